@@ -0,0 +1 @@
+# HTTP routes served next to the Gradio interface
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from scoring.ranking import rank_state_counties
+from utils.exports import EXPORT_MEDIA_TYPES, export_rankings
+from utils.user_preferences import (
+    DEFAULT_FAMILY_SIZE, DEFAULT_LIFESTYLE, DEFAULT_PRIORITY, build_user_preferences
+)
+
+router = APIRouter(prefix="/api/export")
+
+@router.get("/rankings")
+def export_state_rankings(
+    state: str,
+    income: int = Query(120000, gt=0),
+    family_size: int = DEFAULT_FAMILY_SIZE,
+    lifestyle: str = DEFAULT_LIFESTYLE,
+    priorities: str = DEFAULT_PRIORITY,
+    fmt: str = Query("json", alias="format")
+):
+    """Scored and ranked counties for one state as JSON, CSV or Parquet, without rendering a report"""
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+
+    ranking = rank_state_counties(state, income, build_user_preferences(family_size, lifestyle, priorities))
+    if ranking.get("error"):
+        status = 404 if ranking["error"].startswith("Unknown state") else 502
+        raise HTTPException(status_code=status, detail=ranking["error"])
+
+    try:
+        body = export_rankings(ranking["counties"], fmt, state)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=f"Parquet export is not available: {e}")
+
+    filename = f"{state.lower().replace(' ', '_')}_rankings.{fmt}"
+    return Response(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'inline; filename="{filename}"'}
+    )
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from data_sources.census_api import STATE_NAMES, get_county_name
+from data_sources.county_seats import get_county_seat
+from data_sources.image_apis import get_county_images
+from data_sources.image_store import IMAGE_PROXY_PREFIX, THUMBNAIL_FORMATS, get_thumbnail
+
+router = APIRouter(prefix=IMAGE_PROXY_PREFIX)
+
+MEDIA_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+# Thumbnails are content-addressed by source URL, so they never change
+CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+@router.get("/county/{county_fips}")
+def get_county_images_fragment(county_fips: str):
+    """Resolve a county's images and return the markup for its deferred image slot"""
+    if len(county_fips) != 5 or not county_fips.isdigit():
+        raise HTTPException(status_code=404, detail="Unknown county")
+
+    # Queries are built from our own data, never the client's, since results are cached per county for everyone
+    state = STATE_NAMES.get(county_fips[:2])
+    name = get_county_name(county_fips) if state else None
+    if not name:
+        raise HTTPException(status_code=404, detail="Unknown county")
+    seat = get_county_seat(county_fips, name, state)
+
+    # Imported here to avoid a cycle: html_formatting renders the placeholders this route fills
+    from html_formatting import render_images_html
+
+    images = get_county_images(name, state, seat, None, county_fips)
+    headers = {"Cache-Control": "public, max-age=3600"} if images else {"Cache-Control": "no-store"}
+    return JSONResponse(
+        {"fips": county_fips, "count": len(images), "html": render_images_html(images, name)},
+        headers=headers
+    )
+
+@router.get("/{key}/{width}.{ext}")
+def get_county_image_thumbnail(key: str, width: int, ext: str):
+    """Serve a resized copy of a registered county image"""
+    if ext not in THUMBNAIL_FORMATS or not key.isalnum():
+        raise HTTPException(status_code=404, detail="Unknown image")
+
+    # Sync route: FastAPI runs it in a worker thread, so the first download doesn't block the loop
+    path = get_thumbnail(key, width, ext)
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not available")
+    return FileResponse(path, media_type=MEDIA_TYPES[ext], headers=CACHE_HEADERS)
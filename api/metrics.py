@@ -0,0 +1,92 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from data_sources import census_api, image_apis, rate_limit
+from html_formatting import card_cache_info
+from report_service import report_flights
+from utils.admission import report_admission
+from utils.cancellation import session_runs
+from utils.metrics import registry
+from utils.report_cache import report_cache_info
+from utils.state_warmup import state_warmup
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@registry.register_collector
+def collect_report_queue():
+    """Queue depth and in-flight reports from admission control and per-session runs"""
+    admission = report_admission.metrics()
+    runs = session_runs.metrics()
+    decisions = ("admitted", "queued", "rejected_queue_full", "rejected_session_limit")
+    return [
+        ("reports_in_flight", "gauge", "Graph runs holding an admission slot", [({}, admission["active"])]),
+        ("report_queue_depth", "gauge", "Graph runs waiting for an admission slot", [({}, admission["waiting"])]),
+        ("report_slots", "gauge", "Graph runs allowed at once", [({}, admission["max_active"])]),
+        ("report_queue_capacity", "gauge", "Graph runs allowed to wait", [({}, admission["max_queued"])]),
+        ("report_admissions_total", "counter", "Admission decisions for graph runs",
+         [({"decision": decision}, admission[decision]) for decision in decisions]),
+        ("report_sessions_active", "gauge", "Browser sessions with a report running", [({}, runs["active"])]),
+        ("report_runs_superseded_total", "counter", "Report runs cancelled by a newer one from the same session",
+         [({}, runs["superseded"])]),
+    ]
+
+@registry.register_collector
+def collect_dependencies():
+    """Concurrency slots per dependency and quota and circuit state per image provider"""
+    concurrency = rate_limit.get_concurrency_metrics()
+    providers = rate_limit.get_provider_metrics()
+    return [
+        ("dependency_in_flight", "gauge", "Requests holding a concurrency slot",
+         [({"dependency": name}, row["in_flight"]) for name, row in concurrency.items()]),
+        ("dependency_concurrency_limit", "gauge", "Concurrency slots per dependency",
+         [({"dependency": name}, row["limit"]) for name, row in concurrency.items()]),
+        ("dependency_slot_waits_total", "counter", "Requests that had to wait for a concurrency slot",
+         [({"dependency": name}, row["waited"]) for name, row in concurrency.items()]),
+        ("dependency_slot_rejections_total", "counter", "Requests that gave up waiting for a concurrency slot",
+         [({"dependency": name}, row["rejected"]) for name, row in concurrency.items()]),
+        ("provider_circuit_open", "gauge", "1 while a provider's circuit breaker is not closed",
+         [({"provider": name}, row["circuit_state"] != "closed") for name, row in providers.items()]),
+        ("provider_tokens_available", "gauge", "Requests a provider's quota allows right now",
+         [({"provider": name}, row["tokens_available"]) for name, row in providers.items()]),
+        ("provider_skipped_requests_total", "counter", "Requests not sent because of the local quota or an open circuit",
+         [({"provider": name, "reason": reason}, row[f"skipped_{reason}"])
+          for name, row in providers.items() for reason in ("rate_limit", "circuit_open")]),
+        ("provider_rate_limited_responses_total", "counter", "429 responses from a provider",
+         [({"provider": name}, row["rate_limited_responses"]) for name, row in providers.items()]),
+    ]
+
+@registry.register_collector
+def collect_sharing():
+    """Work shared between identical concurrent requests, and cache sizes"""
+    flights = {
+        "census": census_api._census_flight.metrics(),
+        "county_images": image_apis._county_image_flight.metrics(),
+        "reports": report_flights.metrics(),
+    }
+    sizes = {"county_card": card_cache_info()["size"], "report": report_cache_info()["size"]}
+    return [
+        ("single_flight_joined_total", "counter", "Requests that waited on an identical one instead of repeating it",
+         [({"flight": name}, row["joined"]) for name, row in flights.items()]),
+        ("single_flight_in_flight", "gauge", "Distinct computations currently being shared",
+         [({"flight": name}, row["in_flight"]) for name, row in flights.items()]),
+        ("cache_entries", "gauge", "Entries held in an in-memory cache",
+         [({"cache": name}, size) for name, size in sizes.items()]),
+    ]
+
+@registry.register_collector
+def collect_state_warmup():
+    """Background warming of states picked in the form"""
+    warmup = state_warmup.metrics()
+    outcomes = ("started", "joined", "cancelled", "completed", "already_warm", "failed")
+    return [
+        ("state_warmups_total", "counter", "State warm-up requests and how they ended",
+         [({"outcome": outcome}, warmup[outcome]) for outcome in outcomes]),
+        ("state_warmups_in_progress", "gauge", "States being warmed right now", [({}, warmup["in_progress"])]),
+    ]
+
+# Async so the collectors read admission and session state on the event loop that owns it
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, HTTPException, Query
+from utils.ranking_cache import MAX_RANKING_PAGE_SIZE, RANKING_PAGE_SIZE, get_ranking_page
+
+router = APIRouter(prefix="/api/rankings")
+
+@router.get("/{ranking_id}")
+def get_ranking(
+    ranking_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(RANKING_PAGE_SIZE, ge=1, le=MAX_RANKING_PAGE_SIZE)
+):
+    """Next page of ranked counties for a report, sliced from the scoring result it was rendered from"""
+    page = get_ranking_page(ranking_id, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Ranking expired, generate the report again")
+    return page
@@ -0,0 +1,118 @@
+import asyncio
+from typing import List, Literal
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from data_sources.census_api import STATE_FIPS
+from html_formatting import iter_report
+from report_service import (
+    REPORT_TIMEOUT_SECONDS, cancel_report_job, get_report_job, obtain_report_context, render_report_output,
+    submit_report_job
+)
+from scoring.ranking import rank_state_counties
+from utils.admission import AdmissionRejected
+from utils.ranking_cache import MAX_RANKING_PAGE_SIZE, RANKING_PAGE_SIZE, get_ranking_page, store_ranking
+from utils.user_preferences import (
+    DEFAULT_FAMILY_SIZE, DEFAULT_LIFESTYLE, DEFAULT_PRIORITY, build_user_preferences
+)
+
+router = APIRouter(prefix="/api")
+
+class RankingRequest(BaseModel):
+    state: str
+    income: int = Field(120000, gt=0)
+    family_size: int = Field(DEFAULT_FAMILY_SIZE, ge=1)
+    lifestyle: str = DEFAULT_LIFESTYLE
+    priorities: str = DEFAULT_PRIORITY
+    limit: int = Field(RANKING_PAGE_SIZE, ge=1, le=MAX_RANKING_PAGE_SIZE)
+
+class ReportRequest(BaseModel):
+    states: List[str] = Field(..., min_length=1, max_length=2)
+    income: int = Field(..., gt=0)
+    family_size: int = Field(DEFAULT_FAMILY_SIZE, ge=1)
+    lifestyle: str = DEFAULT_LIFESTYLE
+    priorities: str = DEFAULT_PRIORITY
+    output: Literal["json", "html"] = "json"
+
+def check_states(states):
+    unknown = [name for name in states if name not in STATE_FIPS]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown state: {', '.join(unknown)}")
+
+def job_response(job):
+    """Public view of a report job"""
+    body = {key: job[key] for key in ("id", "status", "position", "progress", "message", "stages", "error")}
+    body["poll"] = f"{router.prefix}/jobs/{job['id']}"
+    if job["status"] == "done":
+        body.update(job["result"])
+    return body
+
+@router.post("/rankings")
+def create_ranking(body: RankingRequest):
+    """Score and rank a state's counties; the first page comes back with an id for paging the rest"""
+    check_states([body.state])
+    preferences = build_user_preferences(body.family_size, body.lifestyle, body.priorities)
+    ranking = rank_state_counties(body.state, body.income, preferences)
+    if ranking.get("error"):
+        raise HTTPException(status_code=502, detail=ranking["error"])
+
+    ranking_id = store_ranking(body.state, ranking["counties"])
+    return {"ranking_id": ranking_id, "income": body.income, **get_ranking_page(ranking_id, 0, body.limit)}
+
+async def require_report_context(body):
+    """Report context for a request, with queue, timeout and graph failures turned into HTTP errors"""
+    check_states(body.states)
+    try:
+        report_context = await obtain_report_context(
+            body.states, body.income, body.family_size, body.lifestyle, body.priorities
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Report generation timed out after {REPORT_TIMEOUT_SECONDS} seconds")
+
+    if not report_context:
+        raise HTTPException(status_code=502, detail="Unable to generate a report with these parameters")
+    return report_context
+
+@router.post("/reports")
+async def create_report(body: ReportRequest):
+    """Generate a report and wait for it; use /api/jobs for reports that may take minutes"""
+    report_context = await require_report_context(body)
+    return await asyncio.to_thread(render_report_output, report_context, body.output)
+
+@router.post("/reports/stream")
+async def stream_report_html(body: ReportRequest):
+    """Generate a report and send its HTML as a chunked response, one section at a time.
+
+    The header goes out as soon as the graph is done; county cards follow as their
+    images are resolved. `output` is ignored, the body is always standalone HTML.
+    """
+    report_context = await require_report_context(body)
+    # A plain generator: Starlette pulls each section in its threadpool, so image lookups don't block the loop
+    return StreamingResponse(iter_report(report_context, standalone=True), media_type="text/html; charset=utf-8")
+
+@router.post("/jobs", status_code=202)
+async def create_report_job(body: ReportRequest):
+    """Queue a report in the background and return a job to poll"""
+    check_states(body.states)
+    job = submit_report_job(body.states, body.income, body.family_size, body.lifestyle, body.priorities, body.output)
+    return job_response(job)
+
+# Jobs live on the event loop, so these routes stay async rather than running in the threadpool
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = get_report_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    # Let pollers back off while the report is still being built
+    headers = {} if job["finished_at"] else {"Retry-After": "5"}
+    return JSONResponse(job_response(job), headers=headers)
+
+@router.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Cancel a queued or running report job"""
+    job = cancel_report_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job_response(job)
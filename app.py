@@ -1,28 +1,65 @@
+import sys
+from utils.import_profile import IMPORT_PROFILE_FLAG, STARTUP_LAZY_MODULES, import_profile_requested, profile_imports
+
+# `python app.py --import-profile` starts the app under -X importtime, stops
+# before serving and reports which packages startup spent its time importing
+if __name__ == "__main__" and import_profile_requested():
+    sys.exit(profile_imports(__file__, STARTUP_LAZY_MODULES))
+
 import gradio as gr
 import asyncio
 import os
-import uuid
+from contextlib import aclosing
 from dotenv import load_dotenv
-from build_graph import USCensusAgent
-from langchain_core.messages import HumanMessage
+from data_sources.census_api import STATE_FIPS
+from html_formatting import iter_report
+from report_service import describe_stage, generate_report_context
+from utils.admission import AdmissionRejected
+from utils.cancellation import ReportCancelled, session_runs
+from utils.report_payload import report_payload_html, report_templates_html
+from utils.state_warmup import STATE_WARMUP_ENABLED, state_warmup
+from utils.user_preferences import (
+    LIFESTYLE_CHOICES, PRIORITY_CHOICES, DEFAULT_LIFESTYLE, DEFAULT_PRIORITY, DEFAULT_FAMILY_SIZE,
+    build_user_preferences
+)
 
 load_dotenv(override=True)
 
-# Global variables
-us_census_agent = None
+# "json" sends reports as a compact payload that static/report_renderer.js turns into HTML in the browser
+REPORT_OUTPUT = os.getenv("REPORT_OUTPUT", "html").lower()
+
+REPORT_QUEUED_HTML = """
+<div class="professional-report">
+    <div class="report-header" style="background: #3b82f6;">
+        <h1>⏳ Your report is in line</h1>
+        <p class="subtitle">You are #{position} in the queue. It will start automatically.</p>
+    </div>
+</div>
+"""
+
+REPORT_BUSY_HTML = """
+<div class="professional-report">
+    <div class="report-header" style="background: #f59e0b;">
+        <h1>🚦 Server Busy</h1>
+        <p class="subtitle">{message}</p>
+    </div>
+</div>
+"""
 
-async def setup_graph():
-    """Setup the USCensusAgent and workflow graph once at startup"""
-    global us_census_agent
-    if us_census_agent is None:
-        print("🔧 Setting up USCensusAgent...")
-        us_census_agent = USCensusAgent()
-        await us_census_agent.setup_graph()
-        print("✅ USCensusAgent ready!")
-    return us_census_agent.graph
+def warm_selected_state(field):
+    """Change handler for a state dropdown and the inputs its ranking depends on: warm the picked state in the background"""
+    def warm(state_name, income, family_size, lifestyle, priorities, request: gr.Request = None):
+        if not request or not request.session_hash:
+            return
+        owner = (request.session_hash, field)
+        if not state_name or state_name == "None" or not income or income <= 0:
+            state_warmup.release(owner)
+            return
+        state_warmup.request(owner, state_name, income, build_user_preferences(family_size, lifestyle, priorities))
+    return warm
 
 async def generate_report(analysis_type, state1, state2, income, family_size, 
-                         lifestyle, priorities, progress=gr.Progress()):
+                         lifestyle, priorities, request: gr.Request = None, progress=gr.Progress()):
     """Generate real estate report based on user inputs"""
     
     # Reset progress tracking for new report
@@ -30,88 +67,67 @@ async def generate_report(analysis_type, state1, state2, income, family_size,
     
     # Validation
     if not state1:
-        return "❌ Please select at least one state for analysis."
+        yield "❌ Please select at least one state for analysis."
+        return
     
     if not income or income <= 0:
-        return "❌ Please enter a valid household income."
-    
-    # Setup graph
-    progress(0.1, desc="🔧 Setting up analysis engine...")
-    graph = await setup_graph()
+        yield "❌ Please enter a valid household income."
+        return
     
     # Build query based on inputs
     if analysis_type == "Single State Analysis":
         if state2 and state2 != "None":
             analysis_type = "State Comparison"  # Auto-switch if second state selected
     
-    progress(0.2, desc="📝 Building analysis query...")
-    
-    if analysis_type == "State Comparison" and state2 and state2 != "None":
-        query = f"Compare {state1} vs {state2} for real estate investment"
-    else:
-        query = f"Find me a good place to buy a house in {state1}"
-    
-    # Add family context
-    if family_size > 1:
-        query += f" for my family of {family_size}"
-    
-    # Add income context  
-    if income >= 1000000:
-        query += f" with ${income:,} income"
-    elif income >= 1000:
-        income_k = int(income / 1000)
-        query += f" with ${income_k}k income"
-    else:
-        query += f" with ${income} income"
-    
-    progress(0.3, desc="🔍 Analyzing states and requirements...")
-    
-    # Create user preferences string
-    preferences = f"Family size: {family_size}. Lifestyle: {lifestyle}. Priorities: {priorities}"
-    
     # Build states list based on selections
-    states = []
-    
-    # Add primary state
-    state1_fips = get_state_fips(state1)
-    if state1_fips:
-        states.append({"state_name": state1, "fips_code": state1_fips})
-    
-    # Add second state if comparison
+    state_names = [state1]
     if analysis_type == "State Comparison" and state2 and state2 != "None":
-        state2_fips = get_state_fips(state2)
-        if state2_fips:
-            states.append({"state_name": state2, "fips_code": state2_fips})
-    
-    # Create fresh state for workflow - all structured data, no NLP needed
-    # Use unique thread ID to ensure fresh state
-    thread_id = f"report_{uuid.uuid4().hex[:8]}"
-    state = {
-        "messages": [HumanMessage(content=query)],  # Keep for compatibility
-        "states": states,  # Pre-structured state data
-        "income": str(income),
-        "user_preferences": preferences,
-        "needs_followup": False  # Skip all followup logic
-    }
-    
-    config = {"configurable": {"thread_id": thread_id}}
+        state_names.append(state2)
     
+    # A new report from the same browser session supersedes the one still running
+    run = await session_runs.start(request.session_hash if request else None)
     try:
-        progress(0.4, desc="🏘️ Fetching county data...")
-        
-        result = await asyncio.wait_for(
-            graph.ainvoke(state, config=config),
-            timeout=600  # 10 minute timeout
-        )
-        
-        progress(0.9, desc="📊 Generating final report...")
-        
-        if "final_result" in result and result["final_result"]:
+        result = None
+        try:
+            async with aclosing(generate_report_context(
+                state_names, income, family_size, lifestyle, priorities, run, run.session_id
+            )) as events:
+                async for event in events:
+                    if event[0] == "progress":
+                        progress(event[1], desc=event[2])
+                    elif event[0] == "queued":
+                        progress(0.05, desc=f"⏳ Waiting for a free slot: #{event[1]} in line")
+                        yield REPORT_QUEUED_HTML.format(position=event[1])
+                    elif event[0] == "result":
+                        result = event[1]
+        except AdmissionRejected as e:
+            yield REPORT_BUSY_HTML.format(message=e)
+            return
+        
+        if result.get("report_context") and REPORT_OUTPUT == "json":
+            yield await run.guard(asyncio.to_thread(report_payload_html, result["report_context"]))
+            progress(1.0, desc="✅ Report completed!")
+        elif result.get("report_context"):
+            # Show the header straight away and add sections as they render;
+            # rendering can fetch images, so it runs off the event loop
+            sections = []
+            report_sections = iter_report(result["report_context"])
+            while True:
+                section = await run.guard(asyncio.to_thread(next, report_sections, None))
+                if section is None:
+                    break
+                sections.append(section)
+                # County cards note whether their images were cached, fetched or left to the page
+                for note in run.stages.drain():
+                    progress(min(0.99, 0.9 + 0.01 * len(sections)), desc=describe_stage(note))
+                yield "".join(sections)
+            progress(1.0, desc="✅ Report completed!")
+        elif result.get("final_result"):
             progress(1.0, desc="✅ Report completed!")
             # Return the HTML report - state will be automatically reset by Gradio
-            return result["final_result"]
+            yield result["final_result"]
         else:
-            return """
+            yield """
             <div class="professional-report">
                 <div class="report-header" style="background: #ef4444;">
                     <h1>❌ Report Generation Failed</h1>
@@ -128,8 +144,11 @@ async def generate_report(analysis_type, state1, state2, income, family_size,
             </div>
             """
             
+    except ReportCancelled:
+        # Nobody is looking at this report any more; the newer request owns the output
+        print("🛑 Report superseded by a newer request from the same session")
     except asyncio.TimeoutError:
-        return """
+        yield """
         <div class="professional-report">
             <div class="report-header" style="background: #f59e0b;">
                 <h1>⏰ Analysis Timeout</h1>
@@ -150,7 +169,7 @@ async def generate_report(analysis_type, state1, state2, income, family_size,
         print(f"Error generating report: {e}")
         import traceback
         traceback.print_exc()
-        return f"""
+        yield f"""
         <div class="professional-report">
             <div class="report-header" style="background: #ef4444;">
                 <h1>❌ System Error</h1>
@@ -165,23 +184,8 @@ async def generate_report(analysis_type, state1, state2, income, family_size,
             </div>
         </div>
         """
-
-# State FIPS mapping
-STATE_FIPS = {
-    "Alabama": "01", "Alaska": "02", "Arizona": "04", "Arkansas": "05", 
-    "California": "06", "Colorado": "08", "Connecticut": "09", "Delaware": "10", 
-    "Florida": "12", "Georgia": "13", "Hawaii": "15", "Idaho": "16", 
-    "Illinois": "17", "Indiana": "18", "Iowa": "19", "Kansas": "20", 
-    "Kentucky": "21", "Louisiana": "22", "Maine": "23", "Maryland": "24", 
-    "Massachusetts": "25", "Michigan": "26", "Minnesota": "27", "Mississippi": "28", 
-    "Missouri": "29", "Montana": "30", "Nebraska": "31", "Nevada": "32", 
-    "New Hampshire": "33", "New Jersey": "34", "New Mexico": "35", "New York": "36", 
-    "North Carolina": "37", "North Dakota": "38", "Ohio": "39", "Oklahoma": "40", 
-    "Oregon": "41", "Pennsylvania": "42", "Rhode Island": "44", "South Carolina": "45", 
-    "South Dakota": "46", "Tennessee": "47", "Texas": "48", "Utah": "49", 
-    "Vermont": "50", "Virginia": "51", "Washington": "53", "West Virginia": "54", 
-    "Wisconsin": "55", "Wyoming": "56"
-}
+    finally:
+        session_runs.finish(run)
 
 def get_state_fips(state_name):
     """Get FIPS code for a state"""
@@ -202,7 +206,10 @@ US_STATES = [
 def create_interface():
     with gr.Blocks(
         title="🏡 FamilyHomeFinder - Real Estate Analysis Report",
-        theme=gr.themes.Soft(primary_hue="green", secondary_hue="green")
+        theme=gr.themes.Soft(primary_hue="green", secondary_hue="green"),
+        head='<link rel="stylesheet" href="/static/report.css" /><script src="/static/report.js" defer></script>'
+             '<script src="/static/report_renderer.js" defer></script><script src="/static/ranking_table.js" defer></script>'
+             + report_templates_html()
     ) as demo:
         
         gr.Markdown("""
@@ -253,7 +260,7 @@ def create_interface():
                 family_size = gr.Slider(
                     minimum=1,
                     maximum=8,
-                    value=4,
+                    value=DEFAULT_FAMILY_SIZE,
                     step=1,
                     label="Family Size",
                     info="Total number of people in your household"
@@ -262,24 +269,15 @@ def create_interface():
                 gr.Markdown("## 🏘️ Lifestyle Preferences")
                 
                 lifestyle = gr.Radio(
-                    choices=[
-                        "Urban (city amenities, walkable, public transit)",
-                        "Suburban (family neighborhoods, good schools, parks)", 
-                        "Rural (space, nature, quiet, lower cost)"
-                    ],
-                    value="Suburban (family neighborhoods, good schools, parks)",
+                    choices=LIFESTYLE_CHOICES,
+                    value=DEFAULT_LIFESTYLE,
                     label="Preferred Lifestyle",
                     info="What type of community do you prefer?"
                 )
                 
                 priorities = gr.Radio(
-                    choices=[
-                        "Affordability (lower cost of living, value for money)",
-                        "Investment Growth (property appreciation, job markets)",
-                        "Family Safety (low crime, good schools, healthcare)",
-                        "Balanced (mix of affordability, growth, and safety)"
-                    ],
-                    value="Balanced (mix of affordability, growth, and safety)",
+                    choices=PRIORITY_CHOICES,
+                    value=DEFAULT_PRIORITY,
                     label="Top Priority",
                     info="What matters most in your decision?"
                 )
@@ -330,6 +328,17 @@ def create_interface():
                     inputs=[analysis_type, state1, state2],
                     outputs=[status_text]
                 )
+                
+                # Fetch census data and top county images while the rest of the form is filled in;
+                # budget and preferences change which counties rank on top, so they re-warm too
+                if STATE_WARMUP_ENABLED:
+                    for field, dropdown in (("state1", state1), ("state2", state2)):
+                        for trigger in (dropdown, income, family_size, lifestyle, priorities):
+                            trigger.change(
+                                warm_selected_state(field),
+                                inputs=[dropdown, income, family_size, lifestyle, priorities],
+                                queue=False
+                            )
             
             # RIGHT PANEL - Reports with Tiles
             with gr.Column(scale=2):
@@ -405,7 +414,9 @@ def create_interface():
             fn=generate_report,
             inputs=[analysis_type, state1, state2, income, family_size, lifestyle, priorities],
             outputs=[report_output],
-            show_progress=True
+            show_progress=True,
+            # utils/admission.py limits graph runs and shows queue positions; cache hits need no limit
+            concurrency_limit=None
         ).then(
             fn=lambda: "✅ Report completed! Adjust settings above to generate a new report.",
             outputs=[status_text],
@@ -679,6 +690,22 @@ def create_interface():
             border: 1px solid #e2e8f0;
         }
         
+        /* Image slots waiting for deferred county images */
+        .county-image-placeholder {
+            width: 200px;
+            height: 120px;
+            border-radius: 8px;
+            border: 1px solid #e2e8f0;
+            background: linear-gradient(90deg, #f1f5f9 25%, #e2e8f0 50%, #f1f5f9 75%);
+            background-size: 200% 100%;
+            animation: image-placeholder-shimmer 1.5s ease-in-out infinite;
+        }
+        
+        @keyframes image-placeholder-shimmer {
+            0% { background-position: 200% 0; }
+            100% { background-position: -200% 0; }
+        }
+        
         .insights-section {
             background: #f1f5f9;
             padding: 30px;
@@ -840,4 +867,16 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 7860))
     host = os.getenv("HOST", "0.0.0.0")
     
-    demo.launch()
\ No newline at end of file
+    # Serve Gradio together with the image proxy routes
+    import uvicorn
+    from server import create_app
+    server_app = create_app(demo)
+    if IMPORT_PROFILE_FLAG in sys.argv:
+        sys.exit(0)
+    
+    # Warm the image cache in the background while the app sits idle
+    if os.getenv("IMAGE_PREFETCH_ON_START", "false").lower() == "true":
+        from data_sources.image_prefetch import start_background_prefetch
+        start_background_prefetch()
+    
+    uvicorn.run(server_app, host=host, port=port)
\ No newline at end of file
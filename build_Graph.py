@@ -21,7 +21,9 @@ from utils.data_processing import extract_tool_results_from_messages
 from scoring.county_scoring import detect_tier, calculate_state_medians
 from utils.user_preferences import parse_user_priority
 from langgraph.prebuilt import tools_condition, ToolNode
-from html_formatting import format_single_state_html_report, format_comparison_html_report
+from html_formatting import render_report
+from data_sources import rate_limit
+from utils import metrics
 
 # Create a checkpointer for state persistence
 checkpointer = MemorySaver()
@@ -33,7 +35,10 @@ class AgentState(TypedDict):
     is_comparison: Optional[bool]
     summary: Optional[str]
     insights: Optional[str]
+    insights_fallback: Optional[bool]  # Canned insights were used because the LLM call failed
     final_result: Optional[str]
+    report_context: Optional[dict]  # Arguments for html_formatting.iter_report
+    stream_report: Optional[bool]  # Leave final_result empty; the caller streams report_context instead
     followup_question: Optional[str]
     needs_followup: Optional[bool]
     states: Optional[list]
@@ -96,7 +101,30 @@ class USCensusAgent(BaseModel):
             "route": route
         }
 
-    def single_state_county_lookup(self, state):
+    async def request_tool_calls(self, prompt, states):
+        """Ask the supervisor LLM for the county lookup tool calls.
+
+        The calls are fully determined by the form, so when every LLM slot stays
+        busy they are built directly instead of failing the report.
+        """
+        try:
+            # Awaited, so cancelling a superseded report aborts the request instead of abandoning it
+            async with rate_limit.async_concurrency_slot("llm"):
+                with metrics.external_request("gemini"):
+                    return await self.supervisor_llm_with_tools.ainvoke([{"role": "user", "content": prompt}])
+        except rate_limit.DependencyBusy as e:
+            print(f"⚠️ {e}; calling the county lookup tool directly")
+            return AIMessage(content="", tool_calls=[
+                {
+                    "name": real_estate_investment_tool.__name__,
+                    "args": {"state_fips": info["fips_code"], "state_name": info["state_name"], "filter_bucket": "default"},
+                    "id": f"direct_lookup_{index}",
+                    "type": "tool_call",
+                }
+                for index, info in enumerate(states)
+            ])
+
+    async def single_state_county_lookup(self, state):
         """County lookup node for single state flow - LLM generates tool call"""
         state_info = state["states"][0]
         prompt = SINGLE_STATE_TOOL_CALL_PROMPT.format(
@@ -106,7 +134,7 @@ class USCensusAgent(BaseModel):
         )
         
         # LLM generates tool call
-        response = self.supervisor_llm_with_tools.invoke([{"role": "user", "content": prompt}])
+        response = await self.request_tool_calls(prompt, [state_info])
         
         # Add the AI message with tool calls to state
         result = {
@@ -116,7 +144,7 @@ class USCensusAgent(BaseModel):
         
         return result
 
-    def comparison_county_lookup(self, state):
+    async def comparison_county_lookup(self, state):
         """County lookup node for comparison flow - LLM generates tool calls"""
         state1, state2 = state["states"][:2]
         prompt = COMPARISON_TOOL_CALL_PROMPT.format(
@@ -129,7 +157,7 @@ class USCensusAgent(BaseModel):
         )
         
         # LLM generates tool calls
-        response = self.supervisor_llm_with_tools.invoke([{"role": "user", "content": prompt}])
+        response = await self.request_tool_calls(prompt, [state1, state2])
         
         # Add the AI message with tool calls to state
         return {
@@ -171,7 +199,7 @@ class USCensusAgent(BaseModel):
         
         return {**state, "summary": summary, "tool_output": tool_output}
     
-    def insights_single_state(self, state):
+    async def insights_single_state(self, state):
         summary = state.get("summary", "")
         tool_output = state.get("tool_output", {})
         state_info = state["states"][0]
@@ -192,13 +220,15 @@ class USCensusAgent(BaseModel):
         
         try:
             chain = SINGLE_STATE_INSIGHTS_PROMPT | self.formatter_llm
-            response = chain.invoke({
-                "state_name": state_name,
-                "summary": summary,
-                "tool_output": str(tool_output),
-                "income": income,
-                "user_preferences": f"{user_preferences} (Budget tier: {tier_description})"
-            })
+            async with rate_limit.async_concurrency_slot("llm"):
+                with metrics.external_request("gemini"):
+                    response = await chain.ainvoke({
+                        "state_name": state_name,
+                        "summary": summary,
+                        "tool_output": str(tool_output),
+                        "income": income,
+                        "user_preferences": f"{user_preferences} (Budget tier: {tier_description})"
+                    })
             
             # Parse response using the new format (INSIGHTS: and RECOMMENDATION:)
             content = response.content if hasattr(response, 'content') else str(response)
@@ -218,11 +248,13 @@ class USCensusAgent(BaseModel):
                 insights = content.strip()
                 recommendation = f"Based on this analysis, focus your search on the top-ranked counties in {state_name} for the best combination of value and family amenities."
                 
+            insights_fallback = False
         except Exception as e:
+            insights_fallback = True
             insights = f"Based on your ${income} income and family priorities, {state_name} offers excellent opportunities in the identified counties. Your budget positions you well in the {tier_description} tier, giving you access to quality family neighborhoods with good schools and amenities."
             recommendation = f"Focus your search on the top 3 counties identified in this analysis. These areas offer the best combination of affordability, family amenities, and investment potential for your ${income} budget. Consider visiting these communities to experience the local schools and neighborhood character firsthand."
         
-        return {**state, "insights": insights, "recommendation": recommendation}
+        return {**state, "insights": insights, "recommendation": recommendation, "insights_fallback": insights_fallback}
 
     def assemble_single_state(self, state):
         insights = state.get("insights", "")
@@ -235,19 +267,23 @@ class USCensusAgent(BaseModel):
         income = f"{int(income_raw):,}" if str(income_raw).isdigit() else income_raw
         counties = tool_output.get("data", {}).get(state_name, {}).get("data", [])
 
-        # Use HTML formatting function
-        final_report = format_single_state_html_report(
-            state_name=state_name,
-            income=income,
-            counties=counties,
-            insights=insights,
-            recommendation=recommendation
-        )
+        report_context = {
+            "type": "single_state",
+            "insights_fallback": bool(state.get("insights_fallback")),
+            "args": {
+                "state_name": state_name,
+                "income": income,
+                "counties": counties,
+                "insights": insights,
+                "recommendation": recommendation
+            }
+        }
 
         # Reset state flags for next query
         result = {
             "messages": state.get("messages", []),
-            "final_result": final_report
+            "report_context": report_context,
+            "final_result": None if state.get("stream_report") else render_report(report_context)
         }
 
         return result
@@ -294,7 +330,7 @@ class USCensusAgent(BaseModel):
         
         return {**state, "summary": summary, "tool_output": tool_output}
 
-    def insights_comparison(self, state):
+    async def insights_comparison(self, state):
         summary = state.get("summary", "")
         tool_output = state.get("tool_output", {})
         state1, state2 = state["states"][:2]
@@ -315,14 +351,16 @@ class USCensusAgent(BaseModel):
         
         try:
             chain = COMPARISON_INSIGHTS_PROMPT | self.formatter_llm
-            response = chain.invoke({
-                "state1": name1,
-                "state2": name2,
-                "summary": summary,
-                "tool_output": str(tool_output),
-                "income": income,
-                "user_preferences": f"{user_preferences} (Budget tier: {tier_description})"
-            })
+            async with rate_limit.async_concurrency_slot("llm"):
+                with metrics.external_request("gemini"):
+                    response = await chain.ainvoke({
+                        "state1": name1,
+                        "state2": name2,
+                        "summary": summary,
+                        "tool_output": str(tool_output),
+                        "income": income,
+                        "user_preferences": f"{user_preferences} (Budget tier: {tier_description})"
+                    })
             
             # Parse response (simple split)
             content = response.content if hasattr(response, 'content') else str(response)
@@ -333,12 +371,14 @@ class USCensusAgent(BaseModel):
                 recommendation = parts[1].strip()
             else:
                 takeaways = content.strip()
+            insights_fallback = False
                 
         except Exception as e:
+            insights_fallback = True
             takeaways = f"Comparing {name1} and {name2} for your ${income} budget and family needs."
             recommendation = f"Both states offer unique advantages. Consider visiting the top counties in each state to find the best fit for your family."
             
-        return {**state, "insights": takeaways, "recommendation": recommendation}
+        return {**state, "insights": takeaways, "recommendation": recommendation, "insights_fallback": insights_fallback}
 
     def assemble_comparison(self, state):
         insights = state.get("insights", "")
@@ -352,21 +392,25 @@ class USCensusAgent(BaseModel):
         counties1 = tool_output.get("state1", {}).get("data", {}).get(name1, {}).get("data", [])
         counties2 = tool_output.get("state2", {}).get("data", {}).get(name2, {}).get("data", [])
 
-        # Use HTML formatting function
-        final_report = format_comparison_html_report(
-            name1=name1,
-            name2=name2,
-            income=income,
-            counties1=counties1,
-            counties2=counties2,
-            insights=insights,
-            recommendation=recommendation
-        )
+        report_context = {
+            "type": "comparison",
+            "insights_fallback": bool(state.get("insights_fallback")),
+            "args": {
+                "name1": name1,
+                "name2": name2,
+                "income": income,
+                "counties1": counties1,
+                "counties2": counties2,
+                "insights": insights,
+                "recommendation": recommendation
+            }
+        }
 
         # Reset state flags for next query
         return {
             "messages": state.get("messages", []),
-            "final_result": final_report
+            "report_context": report_context,
+            "final_result": None if state.get("stream_report") else render_report(report_context)
         }
 
     async def build_graph(self):
@@ -376,17 +420,24 @@ class USCensusAgent(BaseModel):
         # Create a single ToolNode for executing tools
         tool_node = ToolNode(self.tools)
 
-        # Add all nodes to the graph
-        graph.add_node("simple_routing", self.simple_routing_node)
-        graph.add_node("single_state_county_lookup", self.single_state_county_lookup)
-        graph.add_node("comparison_county_lookup", self.comparison_county_lookup)
-        graph.add_node("tools", tool_node)
-        graph.add_node("summarize_single_state", self.summarize_single_state)
-        graph.add_node("insights_single_state", self.insights_single_state)
-        graph.add_node("assemble_single_state", self.assemble_single_state)
-        graph.add_node("summarize_comparison", self.summarize_comparison)
-        graph.add_node("insights_comparison", self.insights_comparison)
-        graph.add_node("assemble_comparison", self.assemble_comparison)
+        # Passing config through keeps the ToolNode's injected state and store working inside the timing wrapper
+        async def run_tools(state, config):
+            return await tool_node.ainvoke(state, config)
+
+        # Add all nodes to the graph, each timed for /metrics
+        def add_node(name, node):
+            graph.add_node(name, metrics.timed_node(name, node))
+
+        add_node("simple_routing", self.simple_routing_node)
+        add_node("single_state_county_lookup", self.single_state_county_lookup)
+        add_node("comparison_county_lookup", self.comparison_county_lookup)
+        add_node("tools", run_tools)
+        add_node("summarize_single_state", self.summarize_single_state)
+        add_node("insights_single_state", self.insights_single_state)
+        add_node("assemble_single_state", self.assemble_single_state)
+        add_node("summarize_comparison", self.summarize_comparison)
+        add_node("insights_comparison", self.insights_comparison)
+        add_node("assemble_comparison", self.assemble_comparison)
         
         # Entry point
         graph.set_entry_point("simple_routing")
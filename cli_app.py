@@ -1,10 +1,21 @@
+import os
 import sys
-from build_graph import USCensusAgent
+import time
+import argparse
 import asyncio
 
+# The CLI prints standalone HTML, so images must be inline remote URLs rather
+# than proxied or filled in later by the web page, and the CSS must be inline too.
+# There is no server to page in the full ranking either.
+os.environ.setdefault("IMAGE_PROXY_ENABLED", "false")
+os.environ.setdefault("DEFERRED_IMAGES", "false")
+os.environ.setdefault("INLINE_REPORT_CSS", "true")
+os.environ.setdefault("RANKING_TABLE_ENABLED", "false")
+
 async def run_agent_workflow(query: str):
-    state = {"messages": []}
+    from build_graph import USCensusAgent
     from langchain_core.messages import HumanMessage
+    state = {"messages": []}
     state["messages"].append(HumanMessage(content=query))
     agent = USCensusAgent()
     await agent.setup_graph()
@@ -14,9 +25,129 @@ async def run_agent_workflow(query: str):
     print(report)
     print("\n==========================\n")
 
+def run_prefetch_images(args):
+    """Warm the image cache for curated and top-ranked counties"""
+    from data_sources.image_prefetch import prefetch_all_states
+    totals = prefetch_all_states(args.states or None, top_n=args.top)
+    print(f"\n✅ Prefetch done: {totals['warmed']} warmed, {totals['already_cached']} already cached, "
+          f"{totals['empty']} without images")
+
+def run_image_stats(args):
+    """Print per-template image hit rates and the average cost of a county lookup"""
+    from data_sources import image_cache
+    from data_sources.image_apis import template_yield
+
+    stats = image_cache.get_query_stats(args.provider)
+    if not stats:
+        print("No image query statistics recorded yet.")
+        return
+    print(f"{'provider':<10} {'template':<18} {'attempts':>8} {'hit rate':>8} {'unique/query':>12}")
+    for (provider, template), row in sorted(stats.items(), key=lambda item: (item[0][0], -template_yield(item[1]))):
+        hit_rate = row["unique_images"] / row["returned"] if row["returned"] else 0.0
+        per_query = row["unique_images"] / row["attempts"] if row["attempts"] else 0.0
+        print(f"{provider:<10} {template:<18} {row['attempts']:>8} {hit_rate:>8.0%} {per_query:>12.2f}")
+
+    print()
+    week_ago = time.time() - 7 * 24 * 3600
+    for label, since in (("All time", None), ("Last 7 days", week_ago)):
+        collections = image_cache.get_collection_stats(since)
+        print(f"📊 {label}: {collections['counties']} counties, {collections['avg_queries']} queries, "
+              f"{collections['avg_http_calls']} HTTP calls and {collections['avg_images']} images per county")
+
+def run_export_rankings(args):
+    """Write the scored county ranking for a state without generating a report"""
+    from scoring.ranking import rank_state_counties
+    from utils.exports import export_rankings, parquet_available
+    from utils.user_preferences import build_user_preferences
+
+    # Checked before the Census fetch and scoring, which can take a while
+    if args.format == "parquet":
+        if not args.output:
+            print("❌ Parquet output needs --output", file=sys.stderr)
+            sys.exit(1)
+        if not parquet_available():
+            print("❌ Parquet export needs pyarrow or fastparquet (pip install pyarrow)", file=sys.stderr)
+            sys.exit(1)
+
+    preferences = build_user_preferences(args.family_size, args.lifestyle, args.priorities)
+    ranking = rank_state_counties(args.state, args.income, preferences)
+    if ranking.get("error"):
+        print(f"❌ {ranking['error']}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        data = export_rankings(ranking["counties"], args.format, args.state)
+    except ImportError as e:
+        print(f"❌ Parquet export is not available: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(data)
+        print(f"✅ Wrote {len(ranking['counties'])} counties to {args.output}")
+    else:
+        sys.stdout.write(data.decode("utf-8"))
+
+def run_pregenerate_reports(args):
+    """Pre-render single-state reports for every tier, lifestyle and priority"""
+    from report_service import pregenerate_reports
+    totals = asyncio.run(pregenerate_reports(
+        args.states or None, args.tiers or None, args.family_sizes or None, overwrite=args.overwrite
+    ))
+    print(f"\n✅ Pre-generation done: {totals['generated']} generated, {totals['already_stored']} already stored, "
+          f"{totals['failed']} failed")
+
+COMMANDS = {
+    "prefetch-images": run_prefetch_images,
+    "image-stats": run_image_stats,
+    "export-rankings": run_export_rankings,
+    "pregenerate-reports": run_pregenerate_reports,
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="FamilyHomeFinder command line tools")
+    subparsers = parser.add_subparsers(dest="command")
+
+    prefetch = subparsers.add_parser("prefetch-images", help="Warm the county image cache")
+    prefetch.add_argument("--states", nargs="*", help="State names (default: all states)")
+    prefetch.add_argument("--top", type=int, default=10, help="Most populous counties to add per state")
+
+    stats = subparsers.add_parser("image-stats", help="Show image query hit rates")
+    stats.add_argument("--provider", choices=["unsplash", "pexels", "wikipedia"], help="Only show one provider")
+
+    from utils.user_preferences import DEFAULT_FAMILY_SIZE, DEFAULT_LIFESTYLE, DEFAULT_PRIORITY
+    export = subparsers.add_parser("export-rankings", help="Export a state's ranked counties as JSON, CSV or Parquet")
+    export.add_argument("state", help="State name, e.g. Oregon")
+    export.add_argument("--income", type=int, default=120000, help="Annual household income")
+    export.add_argument("--family-size", type=int, default=DEFAULT_FAMILY_SIZE)
+    export.add_argument("--lifestyle", default=DEFAULT_LIFESTYLE)
+    export.add_argument("--priorities", default=DEFAULT_PRIORITY)
+    export.add_argument("--format", choices=["json", "csv", "parquet"], default="json")
+    export.add_argument("--output", help="File to write (default: stdout)")
+
+    pregenerate = subparsers.add_parser("pregenerate-reports", help="Pre-render common single-state reports")
+    pregenerate.add_argument("--states", nargs="*", help="State names (default: all states)")
+    pregenerate.add_argument("--tiers", nargs="*", choices=["affordable", "move_up", "luxury", "ultra_luxury"],
+                             help="Budget tiers (default: all)")
+    pregenerate.add_argument("--family-sizes", nargs="*", type=int, help=f"Family sizes (default: {DEFAULT_FAMILY_SIZE})")
+    pregenerate.add_argument("--overwrite", action="store_true", help="Regenerate reports that are already stored")
+
+    return parser
+
 if __name__ == "__main__":
+    # `--import-profile` reruns the command under -X importtime and reports where its import time went
+    from utils.import_profile import IMPORT_PROFILE_FLAG, import_profile_requested, profile_imports
+    if import_profile_requested():
+        sys.exit(profile_imports(__file__))
+    if IMPORT_PROFILE_FLAG in sys.argv:
+        sys.argv.remove(IMPORT_PROFILE_FLAG)
+
     if len(sys.argv) < 2:
         print("Usage: python cli_app.py 'Your query here'")
+        print("       python cli_app.py <command> [options]   (commands: " + ", ".join(COMMANDS) + ")")
         sys.exit(1)
-    query = sys.argv[1]
-    asyncio.run(run_agent_workflow(query)) 
\ No newline at end of file
+    if sys.argv[1] in COMMANDS or sys.argv[1] in ("-h", "--help"):
+        args = build_parser().parse_args()
+        COMMANDS[args.command](args)
+    else:
+        query = sys.argv[1]
+        asyncio.run(run_agent_workflow(query))
@@ -1,14 +1,63 @@
 import os
+import time
+import threading
 import requests
 from typing import Dict, Any
 from dotenv import load_dotenv
+from . import rate_limit
+from utils import metrics
+from utils.cancellation import ReportCancelled
+from utils.progress import note_stage
+from utils.single_flight import SingleFlight
 
 load_dotenv()
 CENSUS_API_KEY = os.getenv("CENSUS_API_KEY")
 
+# ACS dataset every figure comes from; part of any cache key built on census values
+CENSUS_DATA_VERSION = "2022/acs/acs5"
+CENSUS_API_URL = f"https://api.census.gov/data/{CENSUS_DATA_VERSION}"
+# Large states take a while to come back, but a request must never hang forever
+CENSUS_API_TIMEOUT = (3.05, 30)
+
+# A published ACS release never changes, so successful responses are kept in memory
+CENSUS_CACHE_TTL = int(os.getenv("CENSUS_CACHE_TTL", 24 * 3600))
+_census_cache = {}
+_census_cache_lock = threading.Lock()
+_census_flight = SingleFlight("census")
+
+# State FIPS mapping
+STATE_FIPS = {
+    "Alabama": "01", "Alaska": "02", "Arizona": "04", "Arkansas": "05", 
+    "California": "06", "Colorado": "08", "Connecticut": "09", "Delaware": "10", 
+    "Florida": "12", "Georgia": "13", "Hawaii": "15", "Idaho": "16", 
+    "Illinois": "17", "Indiana": "18", "Iowa": "19", "Kansas": "20", 
+    "Kentucky": "21", "Louisiana": "22", "Maine": "23", "Maryland": "24", 
+    "Massachusetts": "25", "Michigan": "26", "Minnesota": "27", "Mississippi": "28", 
+    "Missouri": "29", "Montana": "30", "Nebraska": "31", "Nevada": "32", 
+    "New Hampshire": "33", "New Jersey": "34", "New Mexico": "35", "New York": "36", 
+    "North Carolina": "37", "North Dakota": "38", "Ohio": "39", "Oklahoma": "40", 
+    "Oregon": "41", "Pennsylvania": "42", "Rhode Island": "44", "South Carolina": "45", 
+    "South Dakota": "46", "Tennessee": "47", "Texas": "48", "Utah": "49", 
+    "Vermont": "50", "Virginia": "51", "Washington": "53", "West Virginia": "54", 
+    "Wisconsin": "55", "Wyoming": "56"
+}
+STATE_NAMES = {fips: name for name, fips in STATE_FIPS.items()}
+
 def get_census_data(state_fips: str, variables: str) -> Dict[str, Any]:
     """Simple function to get census data for a state"""
-    api_url = "https://api.census.gov/data/2022/acs/acs5"
+    with _census_cache_lock:
+        cached = _census_cache.get((state_fips, variables))
+    fresh = cached is not None and time.time() - cached[0] < CENSUS_CACHE_TTL
+    metrics.count_cache_lookup("census", fresh)
+    note_stage("census", STATE_NAMES.get(state_fips, state_fips), "cached" if fresh else "fetched")
+    if fresh:
+        return {"data": cached[1], "error": None}
+    
+    # Concurrent reports on the same state share one request
+    return _census_flight.do((state_fips, variables), _fetch_census_data, state_fips, variables)
+
+def _fetch_census_data(state_fips, variables):
+    api_url = CENSUS_API_URL
     params = {
         "get": f"NAME,{variables}",
         "for": "county:*",
@@ -17,9 +66,42 @@ def get_census_data(state_fips: str, variables: str) -> Dict[str, Any]:
     }
     
     try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
+        with rate_limit.concurrency_slot("census"), metrics.external_request("census"):
+            response = requests.get(api_url, params=params, timeout=CENSUS_API_TIMEOUT)
+            response.raise_for_status()
         data = response.json()
-        return {"data": data, "error": None}
+    except ReportCancelled:
+        raise
     except Exception as e:
-        return {"data": None, "error": str(e)} 
\ No newline at end of file
+        return {"data": None, "error": str(e)}
+    
+    with _census_cache_lock:
+        _census_cache[(state_fips, variables)] = (time.time(), data)
+    return {"data": data, "error": None}
+
+def get_county_name(county_fips: str):
+    """Return a county's name (e.g. "Multnomah County") for its 5-digit FIPS, or None if unknown"""
+    state_fips, county_code = county_fips[:2], county_fips[2:]
+    if state_fips not in STATE_NAMES:
+        return None
+    # Any census table for the state has the NAME column, and names don't expire
+    with _census_cache_lock:
+        tables = [data for key, (_, data) in _census_cache.items() if key[0] == state_fips]
+    if not tables:
+        # The smallest query, and the same one the image prefetch makes
+        tables = [get_census_data(state_fips, "B01003_001E").get("data") or []]
+    for data in tables:
+        for row in data[1:]:
+            record = dict(zip(data[0], row))
+            if record.get("county") == county_code:
+                return record.get("NAME", "").split(",")[0].strip() or None
+    return None
+
+def has_cached_census_data(state_fips: str) -> bool:
+    """Check whether any census query for a state can be answered from memory"""
+    now = time.time()
+    with _census_cache_lock:
+        return any(
+            key[0] == state_fips and now - fetched_at < CENSUS_CACHE_TTL
+            for key, (fetched_at, _) in _census_cache.items()
+        ) 
\ No newline at end of file
@@ -0,0 +1,39 @@
+import os
+import csv
+
+# County seat (or principal city, where the seat is a small town nobody photographs)
+# for the curated counties and the largest metros, keyed by 5-digit county FIPS.
+# The table is partial (about 500 of 3,100+ counties); counties missing from it
+# get no county_seat and image lookups fall back to the generic query templates.
+COUNTY_SEATS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "county_seats.csv")
+
+_county_seats = None
+
+def load_county_seats():
+    """Read the bundled county seat table once and return it as {fips: row}"""
+    global _county_seats
+    if _county_seats is None:
+        seats = {}
+        try:
+            with open(COUNTY_SEATS_PATH, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    seats[row["fips"]] = row
+        except OSError as e:
+            print(f"County seat table not available: {e}")
+        _county_seats = seats
+    return _county_seats
+
+def get_county_seat(county_fips, county_name=None, state_name=None):
+    """Return the county seat for a FIPS code, or None.
+
+    When a name is given it must match the table, so a renumbered or renamed
+    county never gets another county's seat.
+    """
+    row = load_county_seats().get(county_fips or "")
+    if not row:
+        return None
+    if county_name and row["county"] != county_name:
+        return None
+    if state_name and row["state"] != state_name:
+        return None
+    return row["county_seat"]
@@ -4,16 +4,53 @@ import random
 import hashlib
 from typing import List, Tuple
 from dotenv import load_dotenv
+from . import image_cache, rate_limit
+from utils import metrics
+from utils.cancellation import ReportCancelled, raise_if_cancelled
+from utils.single_flight import SingleFlight
 
 load_dotenv()
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY")
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 
+# Status codes that will not change on retry (bad or missing key, unknown endpoint)
+PERMANENT_ERROR_CODES = (401, 403, 404)
+
+# Fail fast on unreachable hosts, but give slow responses the usual 10 seconds
+IMAGE_API_TIMEOUT = (3.05, 10)
+
+_county_image_flight = SingleFlight("county_images")
+
+def configured_providers():
+    """Image providers that can actually be queried with the current keys"""
+    providers = []
+    if UNSPLASH_ACCESS_KEY:
+        providers.append("unsplash")
+    if PEXELS_API_KEY:
+        providers.append("pexels")
+    providers.append("wikipedia")
+    return providers
+
+def is_permanent_error(error):
+    """Check whether a failed request is worth caching as a negative result"""
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code in PERMANENT_ERROR_CODES
+
+# How a provider query was answered; only "ok" says anything about the query itself
+QUERY_CACHED = "cached"
+QUERY_SKIPPED = "skipped"  # rate limited, circuit open or no free slot: nothing was sent
+QUERY_FAILED = "failed"
+QUERY_OK = "ok"
+
 def fetch_unsplash_image_urls(query, count=1, access_key=UNSPLASH_ACCESS_KEY):
-    """Fetch image URLs from Unsplash API"""
+    """Fetch image URLs from Unsplash API. Returns (images, one of the QUERY_* outcomes)."""
     if not access_key:
-        return []
-    
+        return [], QUERY_SKIPPED
+
+    cached = image_cache.get_query_images("unsplash", query, count)
+    if cached is not None:
+        return cached, QUERY_CACHED
+
     url = "https://api.unsplash.com/search/photos"
     params = {
         "query": query,
@@ -22,21 +59,45 @@ def fetch_unsplash_image_urls(query, count=1, access_key=UNSPLASH_ACCESS_KEY):
     }
     headers = {"Authorization": f"Client-ID {access_key}"}
     
+    permit = False
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
+        with rate_limit.concurrency_slot("images"):
+            # Quota and a half-open probe are only claimed once a slot is held
+            permit = rate_limit.acquire("unsplash")
+            if not permit:
+                return [], QUERY_SKIPPED
+            with metrics.external_request("unsplash"):
+                response = requests.get(url, params=params, headers=headers, timeout=IMAGE_API_TIMEOUT)
+                response.raise_for_status()
         data = response.json()
         results = data.get("results", [])
         images = [(img["id"], img["urls"]["regular"], "Unsplash") for img in results]
-        return images
-    except Exception:
-        return []
+    except ReportCancelled:
+        # A cancelled report must not keep the breaker waiting on its probe
+        rate_limit.release_probe("unsplash", permit)
+        raise
+    except rate_limit.DependencyBusy:
+        return [], QUERY_SKIPPED
+    except Exception as e:
+        rate_limit.record_failure("unsplash", e)
+        if is_permanent_error(e):
+            image_cache.set_query_images("unsplash", query, count, [])
+        return [], QUERY_FAILED
+    else:
+        rate_limit.record_success("unsplash")
+
+    image_cache.set_query_images("unsplash", query, count, images)
+    return images, QUERY_OK
 
 def fetch_pexels_image_urls(query, count=1, api_key=PEXELS_API_KEY):
-    """Fetch image URLs from Pexels API"""
+    """Fetch image URLs from Pexels API. Returns (images, one of the QUERY_* outcomes)."""
     if not api_key:
-        return []
-    
+        return [], QUERY_SKIPPED
+
+    cached = image_cache.get_query_images("pexels", query, count)
+    if cached is not None:
+        return cached, QUERY_CACHED
+
     url = "https://api.pexels.com/v1/search"
     params = {
         "query": query,
@@ -45,105 +106,181 @@ def fetch_pexels_image_urls(query, count=1, api_key=PEXELS_API_KEY):
     }
     headers = {"Authorization": api_key}
     
+    permit = False
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
+        with rate_limit.concurrency_slot("images"):
+            # Quota and a half-open probe are only claimed once a slot is held
+            permit = rate_limit.acquire("pexels")
+            if not permit:
+                return [], QUERY_SKIPPED
+            with metrics.external_request("pexels"):
+                response = requests.get(url, params=params, headers=headers, timeout=IMAGE_API_TIMEOUT)
+                response.raise_for_status()
         data = response.json()
         results = data.get("photos", [])
         images = [(img["id"], img["src"]["large"], "Pexels") for img in results]
-        return images
-    except Exception:
-        return []
+    except ReportCancelled:
+        # A cancelled report must not keep the breaker waiting on its probe
+        rate_limit.release_probe("pexels", permit)
+        raise
+    except rate_limit.DependencyBusy:
+        return [], QUERY_SKIPPED
+    except Exception as e:
+        rate_limit.record_failure("pexels", e)
+        if is_permanent_error(e):
+            image_cache.set_query_images("pexels", query, count, [])
+        return [], QUERY_FAILED
+    else:
+        rate_limit.record_success("pexels")
 
-def fetch_wikipedia_images(county_name, state_name, count=3):
-    """Fetch images from Wikipedia for a county"""
+    image_cache.set_query_images("pexels", query, count, images)
+    return images, QUERY_OK
+
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKIPEDIA_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+WIKIPEDIA_PAGE_IMAGE_LIMIT = 10
+
+def search_wikipedia_page_id(term):
+    """Return the page ID of the top Wikipedia search hit for a term, or None"""
+    cached = image_cache.get_query_images("wikipedia_search", term)
+    if cached is not None:
+        return cached[0][0] if cached else None
+    
+    search_params = {
+        "action": "query",
+        "format": "json",
+        "list": "search",
+        "srsearch": term,
+        "srlimit": 1
+    }
+    
+    permit = False
     try:
-        # Clean county name
-        county_clean = county_name.replace(" County", "").replace(" Parish", "")
-        
-        # Try different search patterns
-        search_terms = [
-            f"{county_clean} County, {state_name}",
-            f"{county_clean}, {state_name}",
-            f"{county_clean} County",
-            f"{county_clean} {state_name}"
-        ]
-        
-        images = []
-        for term in search_terms:
-            if len(images) >= count:
-                break
-                
-            try:
-                # Use Wikipedia API to search for pages
-                search_url = "https://en.wikipedia.org/w/api.php"
-                search_params = {
-                    "action": "query",
-                    "format": "json",
-                    "list": "search",
-                    "srsearch": term,
-                    "srlimit": 1
-                }
-                
-                search_response = requests.get(search_url, params=search_params, timeout=10)
+        with rate_limit.concurrency_slot("images"):
+            # Quota and a half-open probe are only claimed once a slot is held
+            permit = rate_limit.ensure_available("wikipedia")
+            with metrics.external_request("wikipedia"):
+                search_response = requests.get(WIKIPEDIA_API_URL, params=search_params, timeout=IMAGE_API_TIMEOUT)
                 search_response.raise_for_status()
-                search_data = search_response.json()
-                
-                if search_data.get("query", {}).get("search"):
-                    page_id = search_data["query"]["search"][0]["pageid"]
-                    
-                    # Get images from the page
-                    images_url = "https://en.wikipedia.org/w/api.php"
-                    images_params = {
-                        "action": "query",
-                        "format": "json",
-                        "prop": "images",
-                        "pageids": page_id,
-                        "imlimit": 10
-                    }
-                    
-                    images_response = requests.get(images_url, params=images_params, timeout=10)
-                    images_response.raise_for_status()
-                    images_data = images_response.json()
-                    
-                    page_images = images_data.get("query", {}).get("pages", {}).get(str(page_id), {}).get("images", [])
-                    
-                    for img in page_images:
-                        if len(images) >= count:
-                            break
-                            
-                        img_title = img["title"]
-                        if any(ext in img_title.lower() for ext in [".jpg", ".jpeg", ".png", ".gif"]):
-                            # Get image info
-                            info_url = "https://en.wikipedia.org/w/api.php"
-                            info_params = {
-                                "action": "query",
-                                "format": "json",
-                                "prop": "imageinfo",
-                                "titles": img_title,
-                                "iiprop": "url|size"
-                            }
-                            
-                            info_response = requests.get(info_url, params=info_params, timeout=10)
-                            info_response.raise_for_status()
-                            info_data = info_response.json()
-                            
-                            pages = info_data.get("query", {}).get("pages", {})
-                            for page_id, page_data in pages.items():
-                                if page_id != "-1":  # Page exists
-                                    imageinfo = page_data.get("imageinfo", [])
-                                    if imageinfo:
-                                        img_url = imageinfo[0]["url"]
-                                        img_id = f"wiki_{page_id}"
-                                        images.append((img_id, img_url, "Wikipedia"))
-                                        break
-                                        
-            except requests.exceptions.RequestException:
+        results = search_response.json().get("query", {}).get("search", [])
+    except ReportCancelled:
+        # A cancelled report must not keep the breaker waiting on its probe
+        rate_limit.release_probe("wikipedia", permit)
+        raise
+    except rate_limit.ProviderUnavailable:
+        raise
+    except Exception as e:
+        rate_limit.record_failure("wikipedia", e)
+        raise
+    else:
+        rate_limit.record_success("wikipedia")
+    
+    page_id = results[0]["pageid"] if results else None
+    image_cache.set_query_images("wikipedia_search", term, 1, [(page_id,)] if page_id else [])
+    return page_id
+
+def fetch_wikipedia_page_images(page_id):
+    """Resolve every image on a Wikipedia page to a URL in a single request"""
+    cached = image_cache.get_query_images("wikipedia_page", str(page_id), WIKIPEDIA_PAGE_IMAGE_LIMIT)
+    if cached is not None:
+        return cached
+    
+    # generator=images turns the page's image titles into the query's page set,
+    # so prop=imageinfo resolves all of them at once instead of one call per title
+    images_params = {
+        "action": "query",
+        "format": "json",
+        "generator": "images",
+        "pageids": page_id,
+        "gimlimit": "max",
+        "prop": "imageinfo",
+        "iiprop": "url|size"
+    }
+    
+    permit = False
+    try:
+        with rate_limit.concurrency_slot("images"):
+            # Quota and a half-open probe are only claimed once a slot is held
+            permit = rate_limit.ensure_available("wikipedia")
+            with metrics.external_request("wikipedia"):
+                images_response = requests.get(WIKIPEDIA_API_URL, params=images_params, timeout=IMAGE_API_TIMEOUT)
+                images_response.raise_for_status()
+        pages = images_response.json().get("query", {}).get("pages", {})
+    except ReportCancelled:
+        # A cancelled report must not keep the breaker waiting on its probe
+        rate_limit.release_probe("wikipedia", permit)
+        raise
+    except rate_limit.ProviderUnavailable:
+        raise
+    except Exception as e:
+        rate_limit.record_failure("wikipedia", e)
+        raise
+    else:
+        rate_limit.record_success("wikipedia")
+    
+    images = []
+    # Commons-hosted files come back with negative keys, so sort by title for a stable order
+    for page_data in sorted(pages.values(), key=lambda page: page.get("title", "")):
+        img_title = page_data.get("title", "")
+        imageinfo = page_data.get("imageinfo", [])
+        if not imageinfo or not img_title.lower().endswith(WIKIPEDIA_IMAGE_EXTENSIONS):
+            continue
+        images.append((f"wiki_{img_title}", imageinfo[0]["url"], "Wikipedia"))
+        if len(images) >= WIKIPEDIA_PAGE_IMAGE_LIMIT:
+            break
+    
+    image_cache.set_query_images("wikipedia_page", str(page_id), WIKIPEDIA_PAGE_IMAGE_LIMIT, images)
+    return images
+
+def fetch_wikipedia_images(county_name, state_name, count=3):
+    """Fetch images from Wikipedia for a county. Returns (images, one of the QUERY_* outcomes)."""
+    cache_query = f"{county_name}, {state_name}"
+    cached = image_cache.get_query_images("wikipedia", cache_query, count)
+    if cached is not None:
+        return cached, QUERY_CACHED
+    
+    # Clean county name
+    county_clean = county_name.replace(" County", "").replace(" Parish", "")
+    
+    # Try different search patterns
+    search_terms = [
+        f"{county_clean} County, {state_name}",
+        f"{county_clean}, {state_name}",
+        f"{county_clean} County",
+        f"{county_clean} {state_name}"
+    ]
+    
+    images = []
+    seen_pages = set()
+    had_error = False
+    failed = False
+    for term in search_terms:
+        if len(images) >= count:
+            break
+        
+        try:
+            page_id = search_wikipedia_page_id(term)
+            if not page_id or page_id in seen_pages:
                 continue
-                
-        return images[:count]
-    except Exception:
-        return []
+            seen_pages.add(page_id)
+            page_images = fetch_wikipedia_page_images(page_id)
+            images.extend(page_images)
+            # The fallback terms almost always land on the same article, so once
+            # a page with images is found another search rarely adds anything
+            if page_images:
+                break
+        except rate_limit.ProviderUnavailable:
+            had_error = True
+            continue
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            had_error = failed = True
+            continue
+    
+    # Only remember the outcome when every request went through
+    if images or not had_error:
+        image_cache.set_query_images("wikipedia", cache_query, count, images[:count])
+        return images[:count], QUERY_OK
+    return images[:count], QUERY_FAILED if failed else QUERY_SKIPPED
 
 def fetch_serper_image_urls(query, count=3, api_key=None):
     """Fetch image URLs using Serper API (Google Images)"""
@@ -166,64 +303,159 @@ def fetch_serper_image_urls(query, count=3, api_key=None):
     except Exception:
         return []
 
-def get_county_images(county_name, state_name, county_seat=None, used_urls=None):
+def get_county_images(county_name, state_name, county_seat=None, used_urls=None, county_fips=None):
     """Get images for a county from multiple sources, limited to 10 total"""
-    seen_urls = set() if used_urls is None else set(used_urls)
+    images = image_cache.get_county_cached_images(county_fips)
+    metrics.count_cache_lookup("county_images", images is not None)
+    if images is None:
+        # The same county in reports rendering at the same time is collected once
+        flight_key = county_fips or (county_name, state_name)
+        images = _county_image_flight.do(flight_key, _collect_and_cache_county_images,
+                                         county_name, state_name, county_seat, county_fips)
+    
+    # Skip images another county in the same report is already showing
+    if used_urls is not None:
+        images = [(url, source) for url, source in images if url not in used_urls]
+        used_urls.update(url for url, _ in images)
+    
+    return images[:MAX_COUNTY_IMAGES]
+
+def _collect_and_cache_county_images(county_name, state_name, county_seat, county_fips):
+    images, complete = collect_county_images(county_name, state_name, county_seat)
+    # Empty lookups are already negative-cached per provider query, so only
+    # keep real results here and let a transient outage retry next time.
+    # A list missing a skipped or failing provider is kept only briefly.
+    if images:
+        image_cache.set_county_images(county_fips, images, partial=not complete)
+    return images
+
+def has_cached_county_images(county_fips):
+    """Check whether a county's images can be served without calling any provider"""
+    return image_cache.get_county_cached_images(county_fips) is not None
+
+# Query templates by name, so their hit rates can be tracked across runs
+SEAT_QUERY_TEMPLATES = {
+    "seat_downtown": "{seat} {state} downtown",
+    "seat_city": "{seat} {state}",
+    "seat_aerial": "{seat} {state} aerial",
+}
+COUNTY_QUERY_TEMPLATES = {
+    "county_state": "{county} County {state}",
+    "county_short": "{county} {state}",
+    "county_courthouse": "{county} County courthouse",
+    "county_downtown": "{county} County downtown",
+    "county_aerial": "{county} County aerial view",
+}
+
+MAX_COUNTY_IMAGES = 10
+# Templates with at least this many attempts and a lower average yield are skipped
+MIN_TEMPLATE_ATTEMPTS = 5
+MIN_TEMPLATE_YIELD = 0.25
+# Share of counties that also try one skipped template, so a template pruned in a bad spell can recover
+TEMPLATE_EXPLORE_RATE = 0.1
+
+QUERY_FETCHERS = {
+    "unsplash": fetch_unsplash_image_urls,
+    "pexels": fetch_pexels_image_urls,
+}
+
+def template_yield(stats):
+    """Smoothed unique images per query, so untried templates still get a turn"""
+    if not stats:
+        return 1.0
+    return (stats["unique_images"] + 1.0) / (stats["attempts"] + 1.0)
+
+def order_query_templates(provider, template_names, seed):
+    """Best observed yield first; the seeded shuffle only breaks ties"""
+    rng = random.Random(seed)
+    shuffled = list(template_names)
+    rng.shuffle(shuffled)
+    stats = image_cache.get_query_stats(provider)
+
+    ordered = []
+    pruned = []
+    for name in sorted(shuffled, key=lambda n: template_yield(stats.get((provider, n))), reverse=True):
+        template_stats = stats.get((provider, name))
+        if (template_stats and template_stats["attempts"] >= MIN_TEMPLATE_ATTEMPTS
+                and template_yield(template_stats) < MIN_TEMPLATE_YIELD):
+            pruned.append(name)
+            continue
+        ordered.append(name)
+    if pruned and rng.random() < TEMPLATE_EXPLORE_RATE:
+        ordered.append(rng.choice(pruned))
+    # Never end up with nothing to ask
+    return ordered or shuffled[:1]
+
+def collect_county_images(county_name, state_name, county_seat=None):
+    """Query the image providers for a county, limited to 10 unique images.
+
+    Returns (images, complete); complete is False when a provider query was
+    skipped or failed, so the list may be missing images.
+    """
+    seen_urls = set()
     images = []
     county_clean = county_name.replace(" County", "").replace(" Parish", "")
     county_hash = hashlib.md5(f"{county_name}{state_name}".encode()).hexdigest()
     seed_offset = int(county_hash[:4], 16) % 1000
-    queries = []
     
     if county_seat:
-        queries.append(f"{county_seat} {county_clean} {state_name} downtown")
-        queries.append(f"{county_seat} {county_clean} {state_name} main street")
-        queries.append(f"{county_seat} {county_clean} {state_name} courthouse")
-        queries.append(f"{county_seat} {county_clean} {state_name} aerial")
-        queries.append(f"{county_seat} {county_clean} {state_name} landmarks")
-    
-    queries.extend([
-        f"{county_clean} County {state_name}",
-        f"{county_clean} {state_name}",
-        f"{county_clean} County courthouse",
-        f"{county_clean} County downtown",
-        f"{county_clean} County aerial view"
-    ])
-    
-    # Shuffle queries for variety
-    random.seed(seed_offset)
-    random.shuffle(queries)
-    
-    # Try Unsplash first
-    for query in queries:
-        if len(images) >= 10:
-            break
-        unsplash_images = fetch_unsplash_image_urls(query, 2)
-        for img_id, img_url, source in unsplash_images:
-            if img_url not in seen_urls and len(images) < 10:
-                seen_urls.add(img_url)
-                images.append((img_url, source))
+        # A known seat gives precise queries that fill the list on their own,
+        # so ask for bigger pages and keep one generic query as a fallback
+        per_query = 4
+        templates = dict(SEAT_QUERY_TEMPLATES)
+        fallback_templates = ["county_state"]
+    else:
+        per_query = 2
+        templates = dict(COUNTY_QUERY_TEMPLATES)
+        fallback_templates = []
     
-    # Try Pexels
-    for query in queries:
-        if len(images) >= 10:
-            break
-        pexels_images = fetch_pexels_image_urls(query, 2)
-        for img_id, img_url, source in pexels_images:
-            if img_url not in seen_urls and len(images) < 10:
-                seen_urls.add(img_url)
-                images.append((img_url, source))
+    queries_sent = 0
+    http_calls = 0
+    complete = True
+    for provider in ("unsplash", "pexels"):
+        if provider not in configured_providers():
+            continue
+        names = order_query_templates(provider, templates, seed_offset) + fallback_templates
+        for name in names:
+            if len(images) >= MAX_COUNTY_IMAGES:
+                break
+            # Stop spending provider quota on a report nobody is waiting for
+            raise_if_cancelled()
+            template = templates.get(name) or COUNTY_QUERY_TEMPLATES[name]
+            query = template.format(seat=county_seat, county=county_clean, state=state_name)
+            queries_sent += 1
+            
+            results, outcome = QUERY_FETCHERS[provider](query, per_query)
+            if outcome in (QUERY_OK, QUERY_FAILED):
+                http_calls += 1
+            if outcome in (QUERY_SKIPPED, QUERY_FAILED):
+                complete = False
+            added = 0
+            for img_id, img_url, source in results:
+                if img_url not in seen_urls and len(images) < MAX_COUNTY_IMAGES:
+                    seen_urls.add(img_url)
+                    images.append((img_url, source))
+                    added += 1
+            # Cache hits, skips and errors say nothing new about how well the template works
+            if outcome == QUERY_OK:
+                image_cache.record_query_stats(provider, name, len(results), added)
     
     # Try Wikipedia
-    if len(images) < 10:
-        wiki_images = fetch_wikipedia_images(county_name, state_name, 3)
+    if len(images) < MAX_COUNTY_IMAGES:
+        queries_sent += 1
+        wiki_images, outcome = fetch_wikipedia_images(county_name, state_name, 3)
+        if outcome in (QUERY_OK, QUERY_FAILED):
+            http_calls += 1
+        if outcome in (QUERY_SKIPPED, QUERY_FAILED):
+            complete = False
+        added = 0
         for img_id, img_url, source in wiki_images:
-            if img_url not in seen_urls and len(images) < 10:
+            if img_url not in seen_urls and len(images) < MAX_COUNTY_IMAGES:
                 seen_urls.add(img_url)
                 images.append((img_url, source))
+                added += 1
+        if outcome == QUERY_OK:
+            image_cache.record_query_stats("wikipedia", "county_page", len(wiki_images), added)
     
-    # Update used_urls set
-    if used_urls is not None:
-        used_urls.update(seen_urls)
-    
-    return images[:10] 
\ No newline at end of file
+    image_cache.record_county_collection(queries_sent, http_calls, len(images))
+    return images[:MAX_COUNTY_IMAGES], complete
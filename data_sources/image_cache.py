@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", os.path.join(".cache", "image_cache.sqlite3"))
+IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", 30 * 24 * 3600))  # 30 days
+IMAGE_CACHE_NEGATIVE_TTL = int(os.getenv("IMAGE_CACHE_NEGATIVE_TTL", 24 * 3600))  # 1 day
+# County lists collected while a provider was skipped or failing, kept until it is likely back
+IMAGE_CACHE_PARTIAL_TTL = int(os.getenv("IMAGE_CACHE_PARTIAL_TTL", 3600))  # 1 hour
+# Query template counts are halved once they reach this many attempts, so old results fade
+QUERY_STATS_WINDOW = 50
+
+_lock = threading.Lock()
+_connection = None
+
+def _get_connection():
+    """Open the cache database once and create tables on first use"""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(IMAGE_CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(IMAGE_CACHE_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS query_images ("
+            "provider TEXT, query TEXT, count INTEGER, images TEXT, expires_at REAL, "
+            "PRIMARY KEY (provider, query))"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS county_images ("
+            "fips TEXT PRIMARY KEY, images TEXT, expires_at REAL)"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS image_sources ("
+            "key TEXT PRIMARY KEY, url TEXT)"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS query_stats ("
+            "provider TEXT, template TEXT, attempts INTEGER, returned INTEGER, unique_images INTEGER, "
+            "PRIMARY KEY (provider, template))"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS county_collections ("
+            "collected_at REAL, queries INTEGER, http_calls INTEGER, images INTEGER)"
+        )
+        _connection.commit()
+    return _connection
+
+def _expiry(images):
+    """Empty results are cached too, but for a shorter time"""
+    ttl = IMAGE_CACHE_TTL if images else IMAGE_CACHE_NEGATIVE_TTL
+    return time.time() + ttl
+
+def get_query_images(provider, query, count=1):
+    """Return cached images for a provider query, or None on a miss"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT count, images, expires_at FROM query_images WHERE provider = ? AND query = ?",
+                (provider, query)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+
+    if not row or row[2] < time.time():
+        return None
+
+    cached_count, images_json, _ = row
+    images = [tuple(img) for img in json.loads(images_json)]
+    # A smaller cached page only satisfies larger requests if the provider had nothing more
+    if cached_count < count and len(images) >= cached_count:
+        return None
+    return images[:count]
+
+def set_query_images(provider, query, count, images):
+    """Store the images a provider returned for a query (an empty list is a negative entry)"""
+    try:
+        with _lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO query_images (provider, query, count, images, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (provider, query, count, json.dumps(list(images)), _expiry(images))
+            )
+            connection.commit()
+    except sqlite3.Error:
+        pass
+
+def get_county_cached_images(county_fips):
+    """Return the cached (url, source) list for a county FIPS code, or None on a miss"""
+    if not county_fips:
+        return None
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT images, expires_at FROM county_images WHERE fips = ?",
+                (county_fips,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+
+    if not row or row[1] < time.time():
+        return None
+    return [tuple(img) for img in json.loads(row[0])]
+
+def count_cached_state_counties(state_fips):
+    """Number of a state's counties with unexpired, non-empty cached images"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT COUNT(*) FROM county_images WHERE fips LIKE ? AND expires_at >= ? AND images != '[]'",
+                (f"{state_fips}%", time.time())
+            ).fetchone()
+    except sqlite3.Error:
+        return 0
+    return row[0]
+
+def set_county_images(county_fips, images, partial=False):
+    """Store the assembled image list for a county FIPS code; `partial` lists expire sooner"""
+    if not county_fips:
+        return
+    expires_at = time.time() + IMAGE_CACHE_PARTIAL_TTL if partial else _expiry(images)
+    try:
+        with _lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO county_images (fips, images, expires_at) VALUES (?, ?, ?)",
+                (county_fips, json.dumps(list(images)), expires_at)
+            )
+            connection.commit()
+    except sqlite3.Error:
+        pass
+
+def set_image_source(key, url):
+    """Remember which remote URL a proxied image key stands for"""
+    try:
+        with _lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT OR IGNORE INTO image_sources (key, url) VALUES (?, ?)",
+                (key, url)
+            )
+            connection.commit()
+    except sqlite3.Error:
+        pass
+
+def get_image_source(key):
+    """Return the remote URL registered for a proxied image key, or None"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT url FROM image_sources WHERE key = ?", (key,)
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def record_query_stats(provider, template, returned, unique_images):
+    """Count one query of a template: images the provider returned and how many were new"""
+    try:
+        with _lock:
+            connection = _get_connection()
+            # The CASE sees the old attempts in every column, so all three are halved together
+            connection.execute(
+                "INSERT INTO query_stats (provider, template, attempts, returned, unique_images) "
+                "VALUES (?, ?, 1, ?, ?) ON CONFLICT (provider, template) DO UPDATE SET "
+                "attempts = CASE WHEN attempts >= ? THEN attempts / 2 ELSE attempts END + 1, "
+                "returned = CASE WHEN attempts >= ? THEN returned / 2 ELSE returned END + excluded.returned, "
+                "unique_images = CASE WHEN attempts >= ? THEN unique_images / 2 ELSE unique_images END "
+                "+ excluded.unique_images",
+                (provider, template, returned, unique_images,
+                 QUERY_STATS_WINDOW, QUERY_STATS_WINDOW, QUERY_STATS_WINDOW)
+            )
+            connection.commit()
+    except sqlite3.Error:
+        pass
+
+def get_query_stats(provider=None):
+    """Return {(provider, template): {"attempts", "returned", "unique_images"}}"""
+    sql = "SELECT provider, template, attempts, returned, unique_images FROM query_stats"
+    params = ()
+    if provider:
+        sql += " WHERE provider = ?"
+        params = (provider,)
+    try:
+        with _lock:
+            rows = _get_connection().execute(sql, params).fetchall()
+    except sqlite3.Error:
+        return {}
+    return {
+        (row[0], row[1]): {"attempts": row[2], "returned": row[3], "unique_images": row[4]}
+        for row in rows
+    }
+
+def record_county_collection(queries, http_calls, images):
+    """Log one county image collection so the average cost per county can be tracked"""
+    try:
+        with _lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT INTO county_collections (collected_at, queries, http_calls, images) VALUES (?, ?, ?, ?)",
+                (time.time(), queries, http_calls, images)
+            )
+            connection.commit()
+    except sqlite3.Error:
+        pass
+
+def get_collection_stats(since=None):
+    """Averages over county collections, optionally only those after a timestamp"""
+    try:
+        with _lock:
+            row = _get_connection().execute(
+                "SELECT COUNT(*), AVG(queries), AVG(http_calls), AVG(images) "
+                "FROM county_collections WHERE collected_at >= ?",
+                (since or 0,)
+            ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if not row or not row[0]:
+        return {"counties": 0, "avg_queries": 0.0, "avg_http_calls": 0.0, "avg_images": 0.0}
+    return {
+        "counties": row[0],
+        "avg_queries": round(row[1], 2),
+        "avg_http_calls": round(row[2], 2),
+        "avg_images": round(row[3], 2),
+    }
+
+def purge_expired():
+    """Delete expired entries and return how many rows were removed"""
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        removed = connection.execute("DELETE FROM query_images WHERE expires_at < ?", (now,)).rowcount
+        removed += connection.execute("DELETE FROM county_images WHERE expires_at < ?", (now,)).rowcount
+        connection.commit()
+    return removed
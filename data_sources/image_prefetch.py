@@ -0,0 +1,102 @@
+import os
+import threading
+from best_counties_by_state import BEST_COUNTIES_PER_STATE
+from . import image_cache, rate_limit
+from .census_api import STATE_FIPS, get_census_data
+from .county_seats import get_county_seat
+from .image_apis import get_county_images, configured_providers
+
+# How many of the most populous counties to warm per state, on top of the curated list
+PREFETCH_TOP_COUNTIES = int(os.getenv("PREFETCH_TOP_COUNTIES", 10))
+# Only start a county when every provider bucket is this full, leaving the rest for live reports
+PREFETCH_BUCKET_FRACTION = float(os.getenv("PREFETCH_BUCKET_FRACTION", 0.8))
+
+def get_prefetch_targets(state_name, state_fips=None, top_n=PREFETCH_TOP_COUNTIES):
+    """Return curated and most populous counties of a state as dicts with name and fips"""
+    state_fips = state_fips or STATE_FIPS.get(state_name)
+    if not state_fips:
+        return []
+
+    census_result = get_census_data(state_fips, "B01003_001E")
+    raw_data = census_result.get("data") or []
+    if census_result.get("error") or len(raw_data) < 2:
+        return []
+
+    headers = raw_data[0]
+    counties = []
+    for row in raw_data[1:]:
+        record = dict(zip(headers, row))
+        try:
+            population = int(record.get("B01003_001E") or 0)
+        except (TypeError, ValueError):
+            population = 0
+        name = record.get("NAME", "").split(",")[0].strip()
+        fips = f"{record.get('state', '')}{record.get('county', '')}"
+        counties.append({
+            "full_name": record.get("NAME", ""),
+            "name": name,
+            "fips": fips,
+            "county_seat": get_county_seat(fips, name, state_name),
+            "population": population
+        })
+
+    # Curated counties first, then the largest metros
+    curated_names = set(BEST_COUNTIES_PER_STATE.get(state_name, []))
+    curated = [c for c in counties if c["full_name"] in curated_names]
+    by_population = sorted(counties, key=lambda c: c["population"], reverse=True)
+
+    targets = []
+    seen = set()
+    for county in curated + by_population[:top_n]:
+        if county["fips"] not in seen:
+            seen.add(county["fips"])
+            targets.append(county)
+    return targets
+
+def prefetch_state_images(state_name, state_fips=None, top_n=PREFETCH_TOP_COUNTIES, stop_event=None):
+    """Warm the image cache for one state's report counties. Returns counts of warmed/skipped counties."""
+    stats = {"warmed": 0, "already_cached": 0, "empty": 0}
+    providers = configured_providers()
+
+    for county in get_prefetch_targets(state_name, state_fips, top_n):
+        if stop_event is not None and stop_event.is_set():
+            break
+        if image_cache.get_county_cached_images(county["fips"]) is not None:
+            stats["already_cached"] += 1
+            continue
+
+        # Wait for quota instead of letting the providers skip us, otherwise the
+        # county would be cached with whatever a half-empty bucket allowed
+        if not rate_limit.wait_for_capacity(providers, PREFETCH_BUCKET_FRACTION, stop_event):
+            break
+
+        images = get_county_images(county["name"], state_name, county.get("county_seat"),
+                                   county_fips=county["fips"])
+        stats["warmed" if images else "empty"] += 1
+
+    return stats
+
+def prefetch_all_states(states=None, top_n=PREFETCH_TOP_COUNTIES, stop_event=None, verbose=True):
+    """Warm the image cache for every state (or the given ones)"""
+    totals = {"warmed": 0, "already_cached": 0, "empty": 0}
+    for state_name in states or list(STATE_FIPS):
+        if stop_event is not None and stop_event.is_set():
+            break
+        stats = prefetch_state_images(state_name, top_n=top_n, stop_event=stop_event)
+        for key, value in stats.items():
+            totals[key] += value
+        if verbose:
+            print(f"🖼️ {state_name}: {stats['warmed']} warmed, {stats['already_cached']} cached, {stats['empty']} without images")
+    return totals
+
+def start_background_prefetch(states=None, top_n=PREFETCH_TOP_COUNTIES):
+    """Run prefetch_all_states in a daemon thread. Returns (thread, stop_event)."""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=prefetch_all_states,
+        kwargs={"states": states, "top_n": top_n, "stop_event": stop_event},
+        name="image-prefetch",
+        daemon=True
+    )
+    thread.start()
+    return thread, stop_event
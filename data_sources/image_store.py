@@ -0,0 +1,106 @@
+import os
+import io
+import hashlib
+import threading
+import requests
+from dotenv import load_dotenv
+from . import image_cache
+
+load_dotenv()
+IMAGE_PROXY_ENABLED = os.getenv("IMAGE_PROXY_ENABLED", "true").lower() == "true"
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join(".cache", "images"))
+IMAGE_PROXY_PREFIX = "/images"
+
+# Rendered at 200px wide in the report, so these cover 1x, 2x and large screens
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+DEFAULT_WIDTH = 640
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+THUMBNAIL_QUALITY = 80
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+_registered = {}
+# Striped locks so concurrent requests for one image share a single download
+_key_locks = [threading.Lock() for _ in range(64)]
+
+def image_key(url):
+    """Stable key for a remote image URL"""
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+def register_image(url):
+    """Record a remote URL so the proxy will serve it, and return its key.
+
+    The proxy only serves registered keys, so it cannot be used to fetch arbitrary URLs.
+    """
+    key = _registered.get(url)
+    if key is None:
+        key = image_key(url)
+        image_cache.set_image_source(key, url)
+        _registered[url] = key
+    return key
+
+def thumbnail_url(key, width, ext):
+    return f"{IMAGE_PROXY_PREFIX}/{key}/{width}.{ext}"
+
+def thumbnail_srcset(key, ext):
+    return ", ".join(f"{thumbnail_url(key, width, ext)} {width}w" for width in THUMBNAIL_WIDTHS)
+
+def thumbnail_path(key, width, ext):
+    return os.path.join(IMAGE_STORE_DIR, key[:2], f"{key}_{width}.{ext}")
+
+def _lock_for(key):
+    return _key_locks[int(key[:4], 16) % len(_key_locks)]
+
+def _download(url):
+    """Fetch a remote image, refusing anything that is not an image or is too large"""
+    response = requests.get(url, timeout=(3.05, 15), stream=True)
+    response.raise_for_status()
+    if not response.headers.get("Content-Type", "image/").startswith("image/"):
+        raise ValueError(f"Not an image: {url}")
+
+    data = io.BytesIO()
+    for chunk in response.iter_content(64 * 1024):
+        data.write(chunk)
+        if data.tell() > MAX_SOURCE_BYTES:
+            raise ValueError(f"Image too large: {url}")
+    data.seek(0)
+    return data
+
+def _generate_thumbnails(key, url):
+    """Download the original once and write every width in every format"""
+    from PIL import Image
+
+    source = Image.open(_download(url))
+    source = source.convert("RGB")
+    for width in THUMBNAIL_WIDTHS:
+        image = source
+        if source.width > width:
+            height = round(source.height * width / source.width)
+            image = source.resize((width, height), Image.LANCZOS)
+        for ext, pil_format in THUMBNAIL_FORMATS.items():
+            path = thumbnail_path(key, width, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            image.save(temp_path, pil_format, quality=THUMBNAIL_QUALITY)
+            os.replace(temp_path, path)
+
+def get_thumbnail(key, width, ext):
+    """Return the path of a stored thumbnail, generating it on first request. None if unavailable."""
+    if width not in THUMBNAIL_WIDTHS or ext not in THUMBNAIL_FORMATS:
+        return None
+
+    path = thumbnail_path(key, width, ext)
+    if os.path.exists(path):
+        return path
+
+    url = image_cache.get_image_source(key)
+    if not url:
+        return None
+
+    with _lock_for(key):
+        if not os.path.exists(path):
+            try:
+                _generate_thumbnails(key, url)
+            except Exception as e:
+                print(f"Image proxy could not fetch {url}: {e}")
+                return None
+    return path
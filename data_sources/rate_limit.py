@@ -0,0 +1,387 @@
+import os
+import time
+import threading
+import asyncio
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+from utils.cancellation import raise_if_cancelled
+
+load_dotenv()
+
+# Requests per hour and burst size for each image provider. Defaults follow the
+# documented free quotas: Unsplash demo apps get 50/hour, Pexels 200/hour, and
+# Wikipedia has no hard quota but asks clients to stay polite.
+PROVIDER_QUOTAS = {
+    "unsplash": (int(os.getenv("UNSPLASH_REQUESTS_PER_HOUR", 50)), 10),
+    "pexels": (int(os.getenv("PEXELS_REQUESTS_PER_HOUR", 200)), 20),
+    "wikipedia": (int(os.getenv("WIKIPEDIA_REQUESTS_PER_HOUR", 3600)), 30),
+}
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", 300))
+
+# Errors that say nothing about the provider's health
+IGNORED_STATUS_CODES = (404,)
+
+# Requests in flight at once per external dependency. Past the limit a caller waits
+# up to CONCURRENCY_WAIT_SECONDS and then degrades (no images, a census error,
+# template insights) instead of piling more load on a slow service.
+CONCURRENCY_LIMITS = {
+    "census": int(os.getenv("CENSUS_MAX_CONCURRENCY", 4)),
+    "images": int(os.getenv("IMAGE_MAX_CONCURRENCY", 8)),
+    "llm": int(os.getenv("LLM_MAX_CONCURRENCY", 4)),
+}
+CONCURRENCY_WAIT_SECONDS = float(os.getenv("CONCURRENCY_WAIT_SECONDS", 30))
+
+# What acquire() hands out: a normal request, or the single half-open probe that
+# has to end in record_success, record_failure or release_probe
+REQUEST_ALLOWED = "allowed"
+REQUEST_PROBE = "probe"
+
+class ProviderUnavailable(Exception):
+    """Raised when a provider is rate limited locally or its circuit is open"""
+
+class DependencyBusy(ProviderUnavailable):
+    """Raised when every concurrency slot for a dependency stayed taken for too long"""
+
+class TokenBucket:
+    """Classic token bucket: `capacity` burst, refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available without waiting"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for a request that was never sent"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` tokens will be available"""
+        with self.lock:
+            self._refill()
+            missing = tokens - self.tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+    def available(self):
+        with self.lock:
+            self._refill()
+            return self.tokens
+
+class CircuitBreaker:
+    """Skips a provider for a cool-down period after repeated failures"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_until = 0.0
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """Closed: REQUEST_ALLOWED. Open: False until the cool-down ends, then REQUEST_PROBE for one caller."""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return REQUEST_ALLOWED
+            if self.state == self.OPEN and time.monotonic() >= self.open_until:
+                self.state = self.HALF_OPEN
+                return REQUEST_PROBE
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self, retry_after=None):
+        with self.lock:
+            self.consecutive_failures += 1
+            # A 429 or a failed half-open probe opens the circuit straight away
+            if (retry_after is not None or self.state == self.HALF_OPEN
+                    or self.consecutive_failures >= self.failure_threshold):
+                cooldown = max(self.cooldown, retry_after or 0)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.open_until = self.opened_at + cooldown
+                self.times_opened += 1
+                return True
+            return False
+
+    def release_probe(self):
+        """Hand back a half-open probe that ended without an outcome, so the next request probes instead.
+
+        Only the caller that was given REQUEST_PROBE may call this.
+        """
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.open_until = time.monotonic()
+
+    def seconds_until_retry(self):
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.open_until - time.monotonic())
+
+class ProviderGuard:
+    """Token bucket, circuit breaker and counters for one provider"""
+
+    def __init__(self, name, requests_per_hour, burst):
+        self.name = name
+        self.bucket = TokenBucket(burst, requests_per_hour / 3600.0)
+        self.breaker = CircuitBreaker()
+        self.counters = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "rate_limited_responses": 0,
+            "skipped_rate_limit": 0,
+            "skipped_circuit_open": 0,
+        }
+        self.lock = threading.Lock()
+
+    def _count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def acquire(self):
+        """Return REQUEST_ALLOWED or REQUEST_PROBE if a request may be sent now, else False"""
+        if self.breaker.seconds_until_retry() > 0:
+            self._count("skipped_circuit_open")
+            return False
+        if not self.bucket.try_acquire():
+            self._count("skipped_rate_limit")
+            return False
+        # Checked after the bucket so a half-open probe is only claimed when it will be sent
+        permit = self.breaker.allow_request()
+        if not permit:
+            # Another request holds the probe; nothing is sent, so the quota is not spent
+            self.bucket.refund()
+            self._count("skipped_circuit_open")
+            return False
+        self._count("requests")
+        return permit
+
+    def record_success(self):
+        self._count("successes")
+        self.breaker.record_success()
+
+    def record_failure(self, error):
+        response = getattr(error, "response", None)
+        status = response.status_code if response is not None else None
+        if status in IGNORED_STATUS_CODES:
+            self.record_success()
+            return
+
+        self._count("failures")
+        retry_after = None
+        if status == 429:
+            self._count("rate_limited_responses")
+            retry_after = _parse_retry_after(response)
+
+        if self.breaker.record_failure(retry_after):
+            print(f"⚠️ {self.name} circuit open for {self.breaker.seconds_until_retry():.0f}s after: {error}")
+
+    def release_probe(self):
+        self.breaker.release_probe()
+
+    def metrics(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "circuit_state": self.breaker.state,
+            "circuit_times_opened": self.breaker.times_opened,
+            "circuit_retry_in_seconds": round(self.breaker.seconds_until_retry(), 1),
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "tokens_available": round(self.bucket.available(), 2),
+        }
+
+def _parse_retry_after(response):
+    """Read a Retry-After header in seconds, defaulting to the normal cool-down"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return CIRCUIT_COOLDOWN_SECONDS
+
+_guards = {
+    name: ProviderGuard(name, per_hour, burst)
+    for name, (per_hour, burst) in PROVIDER_QUOTAS.items()
+}
+
+def get_guard(provider):
+    return _guards[provider]
+
+def acquire(provider):
+    """Check breaker and quota for a provider before sending a request; returns the permit or False"""
+    return _guards[provider].acquire()
+
+def ensure_available(provider):
+    """Like acquire, but raise ProviderUnavailable instead of returning False"""
+    permit = acquire(provider)
+    if not permit:
+        raise ProviderUnavailable(f"{provider} is rate limited or its circuit is open")
+    return permit
+
+def record_success(provider):
+    _guards[provider].record_success()
+
+def record_failure(provider, error):
+    _guards[provider].record_failure(error)
+
+def release_probe(provider, permit):
+    """Give back a request's half-open probe when it ends without recording an outcome.
+
+    A no-op for any permit but REQUEST_PROBE, so callers that were never given the
+    probe cannot reopen the breaker under the request that holds it.
+    """
+    if permit == REQUEST_PROBE:
+        _guards[provider].release_probe()
+
+def wait_for_capacity(providers, fraction=1.0, stop_event=None, max_wait=None):
+    """Block until each provider's bucket is at least `fraction` full.
+
+    Providers with an open circuit are ignored, since no request would be sent to
+    them anyway. Returns False if `stop_event` was set or `max_wait` elapsed first.
+    """
+    deadline = time.monotonic() + max_wait if max_wait is not None else None
+    while True:
+        waits = []
+        for provider in providers:
+            guard = _guards[provider]
+            if guard.breaker.seconds_until_retry() > 0:
+                continue
+            waits.append(guard.bucket.wait_time(guard.bucket.capacity * fraction))
+        delay = max(waits, default=0.0)
+        if delay <= 0:
+            return True
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            delay = min(delay, remaining)
+        delay = min(delay, 30.0)
+        if stop_event is not None:
+            if stop_event.wait(delay):
+                return False
+        else:
+            time.sleep(delay)
+
+class ConcurrencyLimit:
+    """Bounded semaphore with counters for one external dependency"""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.counters = {"acquired": 0, "waited": 0, "rejected": 0, "in_flight": 0, "peak_in_flight": 0}
+        self.lock = threading.Lock()
+
+    def acquire(self, wait):
+        if not self.semaphore.acquire(blocking=False):
+            with self.lock:
+                self.counters["waited"] += 1
+            # Wait in short slices so a cancelled report stops waiting straight away
+            deadline = time.monotonic() + wait
+            while True:
+                raise_if_cancelled()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self.lock:
+                        self.counters["rejected"] += 1
+                    return False
+                if self.semaphore.acquire(timeout=min(remaining, 0.25)):
+                    break
+        self._acquired()
+        return True
+
+    async def acquire_async(self, wait):
+        """Same as acquire, but waits without blocking the event loop"""
+        if not self.semaphore.acquire(blocking=False):
+            with self.lock:
+                self.counters["waited"] += 1
+            deadline = time.monotonic() + wait
+            while not self.semaphore.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    with self.lock:
+                        self.counters["rejected"] += 1
+                    return False
+                await asyncio.sleep(0.05)
+        self._acquired()
+        return True
+
+    def _acquired(self):
+        with self.lock:
+            self.counters["acquired"] += 1
+            self.counters["in_flight"] += 1
+            self.counters["peak_in_flight"] = max(self.counters["peak_in_flight"], self.counters["in_flight"])
+
+    def release(self):
+        with self.lock:
+            self.counters["in_flight"] -= 1
+        self.semaphore.release()
+
+    def metrics(self):
+        with self.lock:
+            return {**self.counters, "limit": self.limit}
+
+_concurrency = {name: ConcurrencyLimit(name, limit) for name, limit in CONCURRENCY_LIMITS.items()}
+
+@contextmanager
+def concurrency_slot(dependency, wait=CONCURRENCY_WAIT_SECONDS):
+    """Hold one of a dependency's concurrency slots, or raise DependencyBusy after `wait` seconds"""
+    raise_if_cancelled()
+    limit = _concurrency[dependency]
+    if not limit.acquire(wait):
+        raise DependencyBusy(f"{dependency} is at its concurrency limit ({limit.limit})")
+    try:
+        yield
+    finally:
+        limit.release()
+
+@asynccontextmanager
+async def async_concurrency_slot(dependency, wait=CONCURRENCY_WAIT_SECONDS):
+    """concurrency_slot for coroutines; cancelling the awaiting task gives the slot back"""
+    limit = _concurrency[dependency]
+    if not await limit.acquire_async(wait):
+        raise DependencyBusy(f"{dependency} is at its concurrency limit ({limit.limit})")
+    try:
+        yield
+    finally:
+        limit.release()
+
+def get_concurrency_metrics():
+    """In-flight, waiting and rejected counts per external dependency"""
+    return {name: limit.metrics() for name, limit in _concurrency.items()}
+
+def get_provider_metrics():
+    """Snapshot of quota, breaker state and request counters per provider"""
+    return {name: guard.metrics() for name, guard in _guards.items()}
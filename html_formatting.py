@@ -1,14 +1,87 @@
+import os
+import threading
+from collections import OrderedDict
+from string import Template
 from datetime import datetime
-from data_sources.image_apis import get_county_images
-import markdown
+from html import escape
+from data_sources.census_api import CENSUS_DATA_VERSION
+from data_sources.image_apis import get_county_images, has_cached_county_images
+from data_sources.image_store import DEFAULT_WIDTH, IMAGE_PROXY_ENABLED, register_image, thumbnail_srcset, thumbnail_url
+from utils import metrics
+from utils.progress import note_stage
+from utils.ranking_cache import store_ranking
+
+# Render reports straight away and let the page load uncached county images afterwards
+DEFERRED_IMAGES_ENABLED = os.getenv("DEFERRED_IMAGES", "true").lower() == "true"
+IMAGE_PLACEHOLDER_COUNT = 3
+# The web app links static/report.css once; standalone output (the CLI) needs it inline
+INLINE_REPORT_CSS = os.getenv("INLINE_REPORT_CSS", "false").lower() == "true"
+# Table of the counties ranked below the cards, paged in by static/ranking_table.js
+RANKING_TABLE_ENABLED = os.getenv("RANKING_TABLE_ENABLED", "true").lower() == "true"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+REPORT_CSS_PATH = os.path.join(BASE_DIR, "static", "report.css")
+
+# Raw text of every template by name; the page gets these too, so static/report_renderer.js
+# builds the same markup from the JSON payload
+REPORT_TEMPLATES = {}
+
+def load_template(name):
+    """Read an HTML template from templates/ and compile it"""
+    with open(os.path.join(TEMPLATE_DIR, name), encoding="utf-8") as f:
+        # Editors end files with a newline; inside inline markup it would show up as a gap
+        text = f.read().removesuffix("\n")
+    REPORT_TEMPLATES[name.removesuffix(".html")] = text
+    return Template(text)
+
+# Compiled once at import instead of rebuilding the markup on every report
+SINGLE_STATE_HEADER_TEMPLATE = load_template("single_state_header.html")
+COMPARISON_HEADER_TEMPLATE = load_template("comparison_header.html")
+COUNTIES_HEADING_TEMPLATE = load_template("counties_heading.html")
+INSIGHTS_TEMPLATE = load_template("insights_section.html")
+REPORT_FOOTER_HTML = load_template("report_footer.html").template
+COMPARISON_ROW_TEMPLATE = load_template("comparison_row.html")
+COUNTY_CARD_TEMPLATE = load_template("county_card.html")
+COUNTY_CARD_BODY_TEMPLATE = load_template("county_card_body.html")
+STAT_ITEM_TEMPLATE = load_template("stat_item.html")
+SAFETY_BADGE_TEMPLATE = load_template("safety_badge.html")
+SAFETY_RATING_TEMPLATE = load_template("safety_rating.html")
+VS_DIVIDER_HTML = load_template("vs_divider.html").template
+COUNTY_IMAGES_TEMPLATE = load_template("county_images.html")
+COUNTY_IMAGES_PENDING_TEMPLATE = load_template("county_images_pending.html")
+COUNTY_IMAGE_PLACEHOLDER_HTML = load_template("county_image_placeholder.html").template
+COUNTY_IMAGE_TEMPLATE = load_template("county_image.html")
+COUNTY_IMAGE_PROXIED_TEMPLATE = load_template("county_image_proxied.html")
+QUICK_STAT_TEMPLATE = load_template("quick_stat.html")
+RANKING_TABLE_TEMPLATE = load_template("ranking_table.html")
+
+with open(REPORT_CSS_PATH, encoding="utf-8") as f:
+    REPORT_CSS = f.read()
+
+def report_stylesheet_html():
+    """Inline <style> block for standalone reports, empty when the page links report.css"""
+    return f"<style>\n{REPORT_CSS}</style>\n" if INLINE_REPORT_CSS else ""
+
+# Rendered card bodies, shared across reports since popular counties show up in many of them
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", 2048))
+_card_cache = OrderedDict()
+_card_cache_lock = threading.Lock()
+_card_cache_stats = {"hits": 0, "misses": 0}
+
+# markdown.Markdown instances are not thread-safe, so keep one per thread and reset it
+_markdown_local = threading.local()
 
 def clean_markdown_to_html(text):
     """Convert markdown formatting to clean HTML using the markdown package"""
     if not text:
         return ""
-    # Convert markdown to HTML
-    html = markdown.markdown(text)
-    return html
+    converter = getattr(_markdown_local, "converter", None)
+    if converter is None:
+        # Imported here so startup does not pay for it until the first insights are rendered
+        import markdown
+        converter = _markdown_local.converter = markdown.Markdown()
+    return converter.reset().convert(text)
 
 def calculate_homeownership_rate(county):
     """Calculate homeownership rate and return formatted string"""
@@ -64,727 +137,267 @@ def get_safety_display_data(county):
         'color_class': color_class
     }
 
-def format_single_state_html_report(state_name, income, counties, insights, recommendation):
-    """Format the complete single state report as professional HTML with optional crime data"""
-    date = datetime.now().strftime("%B %d, %Y")
-    
-    # Check if any counties have crime data to determine if we should show crime columns
-    has_crime_data = any(county.get('crime_data') for county in counties[:5])
-    
-    # Enhanced CSS with comprehensive safety styling (only if needed)
-    crime_css = '''
-    /* Safety score styling */
-    .safety-excellent .stat-value {
-        color: #22c55e !important;
-        font-weight: 600;
-    }
-    .safety-good .stat-value {
-        color: #84cc16 !important;
-        font-weight: 600;
-    }
-    .safety-moderate .stat-value {
-        color: #f59e0b !important;
-        font-weight: 600;
-    }
-    .safety-concern .stat-value {
-        color: #ef4444 !important;
-        font-weight: 600;
-    }
-    .safety-unknown .stat-value {
-        color: #6b7280 !important;
-    }
-    
-    .safety-badge {
-        display: inline-block;
-        padding: 4px 8px;
-        border-radius: 12px;
-        font-size: 0.8em;
-        font-weight: 500;
-        margin-top: 8px;
-        margin-left: 8px;
-    }
-    
-    .safety-excellent-badge {
-        background: #dcfce7;
-        color: #166534;
-    }
-    
-    .safety-good-badge {
-        background: #ecfdf5;
-        color: #14532d;
-    }
-    
-    .safety-moderate-badge {
-        background: #fef3c7;
-        color: #92400e;
-    }
-    
-    .safety-concern-badge {
-        background: #fee2e2;
-        color: #991b1b;
-    }
-    
-    .safety-unknown-badge {
-        background: #f3f4f6;
-        color: #374151;
-    }
-    ''' if has_crime_data else ''
-    
-    enhanced_css = f'''
-    <style>
-    .professional-report h1, .professional-report h2, .professional-report h3, .professional-report h4 {{
-        margin-top: 1.2em;
-        margin-bottom: 0.5em;
-        font-weight: bold;
-    }}
-    .professional-report p {{
-        margin: 0.5em 0;
-    }}
-    .professional-report ul, .professional-report ol {{
-        margin: 0.5em 0 0.5em 2em;
-    }}
-    .professional-report li {{
-        margin-bottom: 0.3em;
-    }}
-    .professional-report table {{
-        border-collapse: collapse;
-        width: 100%;
-        margin: 1em 0;
-    }}
-    .professional-report th, .professional-report td {{
-        border: 1px solid #ddd;
-        padding: 8px;
-        text-align: left;
-    }}
-    .professional-report th {{
-        background-color: #f2f2f2;
-    }}
-    
-    /* Enhanced stat grid for metrics */
-    .stats-grid {{
-        display: grid;
-        grid-template-columns: repeat(auto-fit, minmax(160px, 1fr));
-        gap: 12px;
-        margin: 20px 0;
-    }}
-    
-    .county-header {{
-        display: flex;
-        align-items: center;
-        margin-bottom: 20px;
-        flex-wrap: wrap;
-    }}
-    
-    {crime_css}
-    </style>
-    '''
-    
-    # Clean the insights and recommendations
-    clean_insights = clean_markdown_to_html(insights)
-    clean_recommendation = clean_markdown_to_html(recommendation)
-    
-    # Generate county cards with conditional crime data
-    county_cards_html = ""
-    used_urls = set()
-    
-    for i, county in enumerate(counties[:5], 1):
-        county_name = county['name']
-        county_seat = county.get('county_seat')
-        
-        # Get images
-        image_urls = get_county_images(county_name, state_name, county_seat, used_urls)
-        for url, _ in image_urls:
-            used_urls.add(url)
-        
-        # Generate image HTML
-        images_html = ""
-        for url, source in image_urls[:10]:
-            if url and url.strip().lower().startswith('http'):
-                images_html += f'<img src="{url}" alt="{county_name}" class="county-image" onerror="this.style.display=\'none\';" />'
-        
-        # County statistics
-        home_value = county.get('B25077_001E', 0)
-        household_income = county.get('B19013_001E', 0)
-        population = county.get('B01003_001E', 0)
-        homeownership = calculate_homeownership_rate(county)
-        college_rate = county.get('college_degree_rate', 0)
-        
-        # Safety data (optional)
+def render_image_html(url, alt, proxy=None):
+    """Build the markup for one county image, served through the local proxy when enabled"""
+    if proxy is None:
+        proxy = IMAGE_PROXY_ENABLED
+    if not proxy:
+        return COUNTY_IMAGE_TEMPLATE.substitute(src=url, alt=alt)
+
+    key = register_image(url)
+    return COUNTY_IMAGE_PROXIED_TEMPLATE.substitute(
+        src=thumbnail_url(key, DEFAULT_WIDTH, "jpg"),
+        webp_srcset=thumbnail_srcset(key, "webp"),
+        jpg_srcset=thumbnail_srcset(key, "jpg"),
+        alt=alt
+    )
+
+def render_images_html(image_urls, county_name, proxy_images=None):
+    """Render the image tags for a county's (url, source) list"""
+    return "".join(
+        render_image_html(url, county_name, proxy_images)
+        for url, _ in image_urls[:10]
+        if url and url.strip().lower().startswith('http')
+    )
+
+def generate_county_images_html(county, state_name, used_urls, defer_images=None, proxy_images=None):
+    """Return the county image strip, or a placeholder carrying the county ID when images aren't cached yet"""
+    if defer_images is None:
+        defer_images = DEFERRED_IMAGES_ENABLED
+    
+    county_name = county['name']
+    county_fips = county.get('fips')
+    county_seat = county.get('county_seat')
+    
+    cached = bool(county_fips) and has_cached_county_images(county_fips)
+    if defer_images and county_fips and not cached:
+        note_stage("images", county_name, "deferred")
+        return COUNTY_IMAGES_PENDING_TEMPLATE.substitute(
+            county_fips=escape(county_fips),
+            placeholders=COUNTY_IMAGE_PLACEHOLDER_HTML * IMAGE_PLACEHOLDER_COUNT
+        )
+    
+    image_urls = get_county_images(county_name, state_name, county_seat, used_urls, county_fips)
+    note_stage("images", county_name, "cached" if cached else "fetched")
+    return COUNTY_IMAGES_TEMPLATE.substitute(images=render_images_html(image_urls, county_name, proxy_images))
+
+def render_stat_items(county, safety_data):
+    """Stat tiles for a county card"""
+    items = [
+        ("Median Home Value", f"${county.get('B25077_001E', 0):,}"),
+        ("Household Income", f"${county.get('B19013_001E', 0):,}"),
+        ("Population", f"{county.get('B01003_001E', 0):,}"),
+        ("Homeownership Rate", calculate_homeownership_rate(county)),
+        ("College Degree Rate", f"{county.get('college_degree_rate', 0)}%"),
+    ]
+    html_parts = [STAT_ITEM_TEMPLATE.substitute(extra_class="", label=label, value=value) for label, value in items]
+    
+    # Add safety stat only if available
+    if safety_data:
+        html_parts.append(STAT_ITEM_TEMPLATE.substitute(
+            extra_class=f" {safety_data['color_class']}", label="Safety Score", value=safety_data['score']
+        ))
+    return "".join(html_parts)
+
+def render_quick_stats(county):
+    """Compact stats for one side of the comparison table"""
+    if not county:
+        values = [("Home Value", "—"), ("Income", "—"), ("Homeownership", "—")]
+        safety_data = None
+    else:
+        values = [
+            ("Home Value", f"${county.get('B25077_001E', 0):,}"),
+            ("Income", f"${county.get('B19013_001E', 0):,}"),
+            ("Homeownership", calculate_homeownership_rate(county)),
+        ]
         safety_data = get_safety_display_data(county)
-        
-        # Build stats grid with conditional safety info
-        stats_items = f'''
-                <div class="stat-item">
-                    <div class="stat-label">Median Home Value</div>
-                    <div class="stat-value">${home_value:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Household Income</div>
-                    <div class="stat-value">${household_income:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Population</div>
-                    <div class="stat-value">{population:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Homeownership Rate</div>
-                    <div class="stat-value">{homeownership}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">College Degree Rate</div>
-                    <div class="stat-value">{college_rate}%</div>
-                </div>'''
-        
-        # Add safety stat only if available
-        if safety_data:
-            stats_items += f'''
-                <div class="stat-item {safety_data['color_class']}">
-                    <div class="stat-label">Safety Score</div>
-                    <div class="stat-value">{safety_data['score']}</div>
-                </div>'''
-        
-        # County description with conditional safety info
-        notable_feature = county.get('tags', {}).get('notable_family_feature', 'Great community for families')
-        
-        # Build header with conditional safety badge
-        header_content = f'''
-                <div class="county-rank">{i}</div>
-                <h3 class="county-name">{county_name}</h3>'''
-        
-        if safety_data:
-            header_content += f'<div class="safety-badge {safety_data["badge_class"]}">{safety_data["tier"]}</div>'
-        
-        # Build description with conditional safety info
-        description_content = f'<strong>Why you\'ll love it:</strong> {notable_feature}'
-        if safety_data:
-            description_content += f'<br><strong>Family Safety:</strong> {safety_data["rating"]}'
-        
-        county_cards_html += f"""
-        <div class="county-card">
-            <div class="county-header">
-                {header_content}
-            </div>
-            
-            <div class="county-images">
-                {images_html}
-            </div>
-            
-            <div class="stats-grid">
-                {stats_items}
-            </div>
-            
-            <div class="county-description">
-                {description_content}
-            </div>
-        </div>
-        """
     
-    # Generate insights section with conditional safety disclaimer
-    safety_disclaimer = '' if has_crime_data else ''
-    
-    insights_html = f"""
-    <div class="insights-section">
-        <h3>💡 Key Insights</h3>
-        <div class="insights-content">
-            {clean_insights if clean_insights else '<p>Our analysis shows excellent opportunities for your family in the identified counties based on your budget and preferences.</p>'}
-        </div>
-        
-        <h3>✨ Our Recommendation</h3>
-        <div class="recommendation-content">
-            {clean_recommendation if clean_recommendation else '<p>Focus your search on the top-ranked counties which offer the best combination of value, family amenities, and investment potential.</p>'}
-        </div>
-        
-        {safety_disclaimer}
-    </div>
-    """
-    
-    # Complete HTML report
-    html_report = f"""
-    {enhanced_css}
-    <div class="professional-report">
-        <div class="report-header">
-            <h1>🏡 {state_name} Real Estate Report</h1>
-            <p class="subtitle">Family-Focused Analysis for ${income} Budget • Generated {date}</p>
-        </div>
-        
-        <div class="report-content">
-            <h2>🏆 Top Counties for Your Family</h2>
-            <p>Based on your budget, family needs, and lifestyle preferences, here are the best counties in {state_name}:</p>
-            
-            {county_cards_html}
-            
-            {insights_html}
-            
-            <div class="report-footer">
-                <p><small>📊 Data Sources: 2022 U.S. Census ACS • Images: Unsplash, Pexels, Wikipedia</small></p>
-            </div>
-        </div>
-    </div>
-    """
-    
-    return html_report
+    html_parts = [QUICK_STAT_TEMPLATE.substitute(extra_class="", label=label, value=value) for label, value in values]
+    if safety_data:
+        html_parts.append(QUICK_STAT_TEMPLATE.substitute(
+            extra_class=f" safety-score-display {safety_data['color_class']}",
+            label="Safety Score", value=safety_data['score']
+        ))
+    return "".join(html_parts)
 
-def format_comparison_html_report(name1, name2, income, counties1, counties2, insights, recommendation):
-    """Format the comparison report with optional crime data"""
-    date = datetime.now().strftime("%B %d, %Y")
-    
-    # Check if any counties have crime data
-    has_crime_data = any(county.get('crime_data') for county in counties1[:3] + counties2[:3])
-    
-    # Enhanced CSS for comparison with optional safety data
-    crime_css = '''
-    .safety-score-display {
-        font-weight: 600;
-    }
-    
-    .safety-excellent { color: #22c55e !important; }
-    .safety-good { color: #84cc16 !important; }
-    .safety-moderate { color: #f59e0b !important; }
-    .safety-concern { color: #ef4444 !important; }
-    .safety-unknown { color: #6b7280 !important; }
-    
-    .safety-badge {
-        display: inline-block;
-        padding: 4px 8px;
-        border-radius: 12px;
-        font-size: 0.8em;
-        font-weight: 500;
-        margin-top: 8px;
-    }
-    
-    .safety-excellent-badge {
-        background: #dcfce7;
-        color: #166534;
-    }
-    
-    .safety-good-badge {
-        background: #ecfdf5;
-        color: #14532d;
-    }
-    
-    .safety-moderate-badge {
-        background: #fef3c7;
-        color: #92400e;
-    }
-    
-    .safety-concern-badge {
-        background: #fee2e2;
-        color: #991b1b;
-    }
-    
-    .safety-unknown-badge {
-        background: #f3f4f6;
-        color: #374151;
-    }
-    ''' if has_crime_data else ''
-    
-    enhanced_comparison_css = f'''
-    <style>
-    .professional-report h1, .professional-report h2, .professional-report h3, .professional-report h4 {{
-        margin-top: 1.2em;
-        margin-bottom: 0.5em;
-        font-weight: bold;
-    }}
-    .professional-report p {{
-        margin: 0.5em 0;
-    }}
-    .professional-report ul, .professional-report ol {{
-        margin: 0.5em 0 0.5em 2em;
-    }}
-    .professional-report li {{
-        margin-bottom: 0.3em;
-    }}
-    
-    /* Enhanced comparison table styling with optional safety */
-    .comparison-container {{
-        background: linear-gradient(135deg, #f8fafc 0%, #e2e8f0 100%);
-        padding: 24px;
-        border-radius: 16px;
-        margin: 24px 0;
-        border: 1px solid #e2e8f0;
-    }}
-    
-    .comparison-grid {{
-        display: grid;
-        grid-template-columns: auto 1fr 1fr;
-        gap: 16px;
-        align-items: center;
-    }}
-    
-    .comparison-rank {{
-        background: linear-gradient(135deg, #3b82f6 0%, #1d4ed8 100%);
-        color: white;
-        width: 48px;
-        height: 48px;
-        border-radius: 12px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-weight: bold;
-        font-size: 1.1em;
-        grid-row: span 2;
-    }}
-    
-    .state-section {{
-        background: white;
-        padding: 20px;
-        border-radius: 12px;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.05);
-        border: 1px solid #e5e7eb;
-    }}
-    
-    .state-header {{
-        font-size: 1.1em;
-        font-weight: 600;
-        color: #1e293b;
-        margin-bottom: 8px;
-        padding-bottom: 8px;
-        border-bottom: 2px solid #e5e7eb;
-    }}
-    
-    .county-name {{
-        font-size: 1em;
-        font-weight: 500;
-        color: #374151;
-        margin-bottom: 12px;
-    }}
-    
-    .quick-stats {{
-        display: grid;
-        grid-template-columns: 1fr 1fr;
-        gap: 12px;
-    }}
-    
-    .quick-stat {{
-        text-align: center;
-    }}
-    
-    .quick-stat-label {{
-        font-size: 0.75em;
-        color: #6b7280;
-        margin-bottom: 4px;
-        text-transform: uppercase;
-        font-weight: 500;
-        letter-spacing: 0.5px;
-    }}
-    
-    .quick-stat-value {{
-        font-size: 0.95em;
-        font-weight: 600;
-        color: #1f2937;
-    }}
-    
-    .vs-divider {{
-        text-align: center;
-        margin: 24px 0;
-        position: relative;
-    }}
-    
-    .vs-divider::before {{
-        content: '';
-        position: absolute;
-        top: 50%;
-        left: 0;
-        right: 0;
-        height: 1px;
-        background: linear-gradient(90deg, transparent, #d1d5db, transparent);
-    }}
-    
-    .vs-text {{
-        background: white;
-        padding: 8px 16px;
-        font-weight: 600;
-        color: #6b7280;
-        border-radius: 20px;
-        border: 1px solid #e5e7eb;
-        display: inline-block;
-    }}
-    
-    .safety-disclaimer {{
-        background: #f8fafc;
-        border: 1px solid #e2e8f0;
-        border-left: 4px solid #3b82f6;
-        padding: 16px;
-        margin: 24px 0;
-        border-radius: 8px;
-    }}
-    
-    .safety-disclaimer h4 {{
-        margin-top: 0;
-        color: #1e293b;
-    }}
-    
-    {crime_css}
-    
-    @media (max-width: 768px) {{
-        .comparison-grid {{
-            grid-template-columns: 1fr;
-            text-align: center;
-        }}
-        .comparison-rank {{
-            grid-row: span 1;
-            margin: 0 auto;
-        }}
-        .quick-stats {{
-            grid-template-columns: 1fr;
-        }}
-    }}
-    </style>
-    '''
-    
-    # Clean the insights and recommendations
-    clean_insights = clean_markdown_to_html(insights)
-    clean_recommendation = clean_markdown_to_html(recommendation)
+def render_county_card(county, state_name, rank, used_urls, defer_images=None, proxy_images=None):
+    """Render one county card. The body is cached; only the rank badge differs between reports."""
+    # Images (or a placeholder that the page fills in once they are found)
+    images_html = generate_county_images_html(county, state_name, used_urls, defer_images, proxy_images)
+    
+    # Safety data (optional)
+    safety_data = get_safety_display_data(county)
+    notable_feature = county.get('tags', {}).get('notable_family_feature', 'Great community for families')
+    
+    fields = (
+        county['name'], notable_feature,
+        county.get('B25077_001E', 0), county.get('B19013_001E', 0), county.get('B01003_001E', 0),
+        county.get('B25003_001E', 0), county.get('B25003_002E', 0), county.get('college_degree_rate', 0),
+        tuple(sorted(safety_data.items())) if safety_data else None,
+    )
+    key = (county.get('fips') or county['name'], CENSUS_DATA_VERSION, images_html, fields)
+    
+    with _card_cache_lock:
+        body = _card_cache.get(key)
+        if body is not None:
+            _card_cache.move_to_end(key)
+            _card_cache_stats["hits"] += 1
+    metrics.count_cache_lookup("county_card", body is not None)
+    
+    if body is None:
+        body = COUNTY_CARD_BODY_TEMPLATE.substitute(
+            county_name=county['name'],
+            safety_badge=SAFETY_BADGE_TEMPLATE.substitute(safety_data) if safety_data else "",
+            images=images_html,
+            stats=render_stat_items(county, safety_data),
+            notable_feature=notable_feature,
+            safety_rating=SAFETY_RATING_TEMPLATE.substitute(safety_data) if safety_data else ""
+        )
+        with _card_cache_lock:
+            _card_cache_stats["misses"] += 1
+            _card_cache[key] = body
+            while len(_card_cache) > CARD_CACHE_SIZE:
+                _card_cache.popitem(last=False)
+    
+    return COUNTY_CARD_TEMPLATE.substitute(rank=rank, body=body)
+
+def card_cache_info():
+    """Hit/miss counters and current size of the county card cache"""
+    with _card_cache_lock:
+        return {**_card_cache_stats, "size": len(_card_cache), "max_size": CARD_CACHE_SIZE}
+
+def render_ranking_section(state_name, counties, shown):
+    """Empty table for the counties ranked below the cards; the page loads its rows on demand"""
+    if not RANKING_TABLE_ENABLED or len(counties) <= shown:
+        return ""
+    return RANKING_TABLE_TEMPLATE.substitute(
+        state_name=state_name,
+        ranking_id=store_ranking(state_name, counties),
+        shown=shown,
+        remaining=len(counties) - shown,
+        total=len(counties)
+    )
+
+# Shown when the LLM left a section empty
+INSIGHTS_FALLBACKS = {
+    "single_state": (
+        '<p>Our analysis shows excellent opportunities for your family in the identified counties based on your budget and preferences.</p>',
+        '<p>Focus your search on the top-ranked counties which offer the best combination of value, family amenities, and investment potential.</p>',
+    ),
+    "comparison": (
+        '<p>Both states offer unique advantages for your family and budget.</p>',
+        '<p>Consider visiting the top counties in both states to find the best fit for your family needs.</p>',
+    ),
+}
+
+def render_insights_html(report_type, insights, recommendation):
+    """Insights and recommendation markdown as HTML, with the fallback text for empty sections"""
+    fallback_insights, fallback_recommendation = INSIGHTS_FALLBACKS[report_type]
+    return (
+        clean_markdown_to_html(insights) or fallback_insights,
+        clean_markdown_to_html(recommendation) or fallback_recommendation,
+    )
+
+def iter_single_state_html_report(state_name, income, counties, insights, recommendation, defer_images=None,
+                                  proxy_images=None):
+    """Yield the single state report section by section: header, county cards, insights, footer"""
+    yield SINGLE_STATE_HEADER_TEMPLATE.substitute(
+        stylesheet=report_stylesheet_html(),
+        state_name=state_name,
+        income=income,
+        date=datetime.now().strftime("%B %d, %Y")
+    )
     
-    # Generate improved comparison section
-    comparison_html = ""
     used_urls = set()
+    for i, county in enumerate(counties[:5], 1):
+        yield render_county_card(county, state_name, i, used_urls, defer_images, proxy_images)
+    yield render_ranking_section(state_name, counties, 5)
     
-    max_counties = max(len(counties1), len(counties2))
-    for i in range(min(3, max_counties)):  # Top 3 from each state
+    insights_html, recommendation_html = render_insights_html("single_state", insights, recommendation)
+    yield INSIGHTS_TEMPLATE.substitute(title="💡 Key Insights", insights=insights_html, recommendation=recommendation_html)
+    yield REPORT_FOOTER_HTML
+
+def format_single_state_html_report(state_name, income, counties, insights, recommendation, defer_images=None,
+                                    proxy_images=None):
+    """Format the complete single state report as professional HTML with optional crime data"""
+    return "".join(iter_single_state_html_report(state_name, income, counties, insights, recommendation,
+                                                 defer_images, proxy_images))
+
+def iter_comparison_html_report(name1, name2, income, counties1, counties2, insights, recommendation, defer_images=None,
+                                proxy_images=None):
+    """Yield the comparison report section by section: header, comparison rows, county cards, insights, footer"""
+    yield COMPARISON_HEADER_TEMPLATE.substitute(
+        stylesheet=report_stylesheet_html(),
+        name1=name1,
+        name2=name2,
+        income=income,
+        date=datetime.now().strftime("%B %d, %Y")
+    )
+    
+    row_count = min(3, max(len(counties1), len(counties2)))  # Top 3 from each state
+    for i in range(row_count):
         county1 = counties1[i] if i < len(counties1) else None
         county2 = counties2[i] if i < len(counties2) else None
         
-        rank = i + 1
-        
-        # County 1 data
-        if county1:
-            name1_county = county1['name']
-            home1 = f"${county1.get('B25077_001E', 0):,}"
-            income1 = f"${county1.get('B19013_001E', 0):,}"
-            homeownership1 = calculate_homeownership_rate(county1)
-            safety1_data = get_safety_display_data(county1)
-        else:
-            name1_county = "—"
-            home1 = income1 = homeownership1 = "—"
-            safety1_data = None
-        
-        # County 2 data
-        if county2:
-            name2_county = county2['name']
-            home2 = f"${county2.get('B25077_001E', 0):,}"
-            income2 = f"${county2.get('B19013_001E', 0):,}"
-            homeownership2 = calculate_homeownership_rate(county2)
-            safety2_data = get_safety_display_data(county2)
-        else:
-            name2_county = "—"
-            home2 = income2 = homeownership2 = "—"
-            safety2_data = None
-        
-        # Build stat grids with conditional safety info
-        stats1 = f'''
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Home Value</div>
-                            <div class="quick-stat-value">{home1}</div>
-                        </div>
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Income</div>
-                            <div class="quick-stat-value">{income1}</div>
-                        </div>
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Homeownership</div>
-                            <div class="quick-stat-value">{homeownership1}</div>
-                        </div>'''
-        
-        if safety1_data:
-            stats1 += f'''
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Safety Score</div>
-                            <div class="quick-stat-value safety-score-display {safety1_data['color_class']}">{safety1_data['score']}</div>
-                        </div>'''
-        
-        stats2 = f'''
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Home Value</div>
-                            <div class="quick-stat-value">{home2}</div>
-                        </div>
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Income</div>
-                            <div class="quick-stat-value">{income2}</div>
-                        </div>
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Homeownership</div>
-                            <div class="quick-stat-value">{homeownership2}</div>
-                        </div>'''
-        
-        if safety2_data:
-            stats2 += f'''
-                        <div class="quick-stat">
-                            <div class="quick-stat-label">Safety Score</div>
-                            <div class="quick-stat-value safety-score-display {safety2_data['color_class']}">{safety2_data['score']}</div>
-                        </div>'''
-        
-        comparison_html += f"""
-        <div class="comparison-container">
-            <div class="comparison-grid">
-                <div class="comparison-rank">#{rank}</div>
-                
-                <div class="state-section">
-                    <div class="state-header">{name1}</div>
-                    <div class="county-name">{name1_county}</div>
-                    <div class="quick-stats">
-                        {stats1}
-                    </div>
-                </div>
-                
-                <div class="state-section">
-                    <div class="state-header">{name2}</div>
-                    <div class="county-name">{name2_county}</div>
-                    <div class="quick-stats">
-                        {stats2}
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
-        
-        # Add VS divider between items (except after the last one)
-        if i < min(3, max_counties) - 1:
-            comparison_html += '<div class="vs-divider"><span class="vs-text">VS</span></div>'
-    
-    # Generate detailed county sections
-    counties1_html = generate_state_counties_html(name1, counties1[:3], used_urls)
-    counties2_html = generate_state_counties_html(name2, counties2[:3], used_urls)
-    
-    # Safety disclaimer
-    safety_disclaimer = ''
-    
-    # Complete HTML report
-    html_report = f"""
-    {enhanced_comparison_css}
-    <div class="professional-report">
-        <div class="report-header">
-            <h1>🏡 {name1} vs {name2}</h1>
-            <p class="subtitle">State Comparison Analysis for ${income} Budget • Generated {date}</p>
-        </div>
-        
-        <div class="report-content">
-            <h2>📊 Quick Comparison</h2>
-            {comparison_html}
-            
-            <h2>🏆 Top Counties in {name1}</h2>
-            {counties1_html}
-            
-            <h2>🌟 Top Counties in {name2}</h2>
-            {counties2_html}
-            
-            <div class="insights-section">
-                <h3>💡 Key Takeaways</h3>
-                <div class="insights-content">
-                    {clean_insights if clean_insights else '<p>Both states offer unique advantages for your family and budget.</p>'}
-                </div>
-                
-                <h3>✨ Our Recommendation</h3>
-                <div class="recommendation-content">
-                    {clean_recommendation if clean_recommendation else '<p>Consider visiting the top counties in both states to find the best fit for your family needs.</p>'}
-                </div>
-                
-                {safety_disclaimer}
-            </div>
-            
-            <div class="report-footer">
-                <p><small>📊 Data Sources: 2022 U.S. Census ACS • Images: Unsplash, Pexels, Wikipedia</small></p>
-            </div>
-        </div>
-    </div>
-    """
-    
-    return html_report
+        # VS divider between rows
+        if i > 0:
+            yield VS_DIVIDER_HTML
+        yield COMPARISON_ROW_TEMPLATE.substitute(
+            rank=i + 1,
+            name1=name1,
+            name2=name2,
+            county1=county1['name'] if county1 else "—",
+            county2=county2['name'] if county2 else "—",
+            stats1=render_quick_stats(county1),
+            stats2=render_quick_stats(county2)
+        )
+    
+    # Detailed county sections
+    used_urls = set()
+    yield COUNTIES_HEADING_TEMPLATE.substitute(icon="🏆", state_name=name1)
+    yield from iter_state_counties_html(name1, counties1[:3], used_urls, defer_images, proxy_images)
+    yield render_ranking_section(name1, counties1, 3)
+    yield COUNTIES_HEADING_TEMPLATE.substitute(icon="🌟", state_name=name2)
+    yield from iter_state_counties_html(name2, counties2[:3], used_urls, defer_images, proxy_images)
+    yield render_ranking_section(name2, counties2, 3)
+    
+    insights_html, recommendation_html = render_insights_html("comparison", insights, recommendation)
+    yield INSIGHTS_TEMPLATE.substitute(title="💡 Key Takeaways", insights=insights_html, recommendation=recommendation_html)
+    yield REPORT_FOOTER_HTML
 
-def generate_state_counties_html(state_name, counties, used_urls):
-    """Generate HTML for counties in a specific state with optional safety data"""
-    counties_html = ""
-    
+def format_comparison_html_report(name1, name2, income, counties1, counties2, insights, recommendation, defer_images=None,
+                                  proxy_images=None):
+    """Format the comparison report with optional crime data"""
+    return "".join(iter_comparison_html_report(name1, name2, income, counties1, counties2, insights, recommendation,
+                                               defer_images, proxy_images))
+
+def iter_state_counties_html(state_name, counties, used_urls, defer_images=None, proxy_images=None):
+    """Yield one county card at a time for a state's counties"""
     for i, county in enumerate(counties, 1):
-        county_name = county['name']
-        county_seat = county.get('county_seat')
-        
-        # Get images
-        image_urls = get_county_images(county_name, state_name, county_seat, used_urls)
-        for url, _ in image_urls:
-            used_urls.add(url)
-        
-        # Generate image HTML
-        images_html = ""
-        for url, source in image_urls[:10]:
-            if url and url.strip().lower().startswith('http'):
-                images_html += f'<img src="{url}" alt="{county_name}" class="county-image" onerror="this.style.display=\'none\';" />'
-        
-        # County statistics
-        home_value = county.get('B25077_001E', 0)
-        household_income = county.get('B19013_001E', 0)
-        population = county.get('B01003_001E', 0)
-        homeownership = calculate_homeownership_rate(county)
-        college_rate = county.get('college_degree_rate', 0)
-        
-        # Safety data (optional)
-        safety_data = get_safety_display_data(county)
-        
-        # Build stats grid with conditional safety info
-        stats_items = f'''
-                <div class="stat-item">
-                    <div class="stat-label">Median Home Value</div>
-                    <div class="stat-value">${home_value:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Household Income</div>
-                    <div class="stat-value">${household_income:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Population</div>
-                    <div class="stat-value">{population:,}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">Homeownership Rate</div>
-                    <div class="stat-value">{homeownership}</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-label">College Degree Rate</div>
-                    <div class="stat-value">{college_rate}%</div>
-                </div>'''
-        
-        # Add safety stat only if available
-        if safety_data:
-            stats_items += f'''
-                <div class="stat-item {safety_data['color_class']}">
-                    <div class="stat-label">Safety Score</div>
-                    <div class="stat-value">{safety_data['score']}</div>
-                </div>'''
-        
-        # County description with conditional safety info
-        notable_feature = county.get('tags', {}).get('notable_family_feature', 'Great community for families')
-        
-        # Build header with conditional safety badge
-        header_content = f'''
-                <div class="county-rank">{i}</div>
-                <h3 class="county-name">{county_name}</h3>'''
-        
-        if safety_data:
-            header_content += f'<div class="safety-badge {safety_data["badge_class"]}">{safety_data["tier"]}</div>'
-        
-        # Build description with conditional safety info
-        description_content = f'<strong>Why you\'ll love it:</strong> {notable_feature}'
-        if safety_data:
-            description_content += f'<br><strong>Family Safety:</strong> {safety_data["rating"]}'
-        
-        counties_html += f"""
-        <div class="county-card">
-            <div class="county-header">
-                {header_content}
-            </div>
-            
-            <div class="county-images">
-                {images_html}
-            </div>
-            
-            <div class="stats-grid">
-                {stats_items}
-            </div>
-            
-            <div class="county-description">
-                {description_content}
-            </div>
-        </div>
-        """
-    
-    return counties_html
\ No newline at end of file
+        yield render_county_card(county, state_name, i, used_urls, defer_images, proxy_images)
+
+def generate_state_counties_html(state_name, counties, used_urls, defer_images=None, proxy_images=None):
+    """Generate HTML for counties in a specific state with optional safety data"""
+    return "".join(iter_state_counties_html(state_name, counties, used_urls, defer_images, proxy_images))
+
+REPORT_ITERATORS = {
+    "single_state": iter_single_state_html_report,
+    "comparison": iter_comparison_html_report,
+}
+
+def iter_report(report_context, standalone=False):
+    """Yield report sections for a context saved by the graph ({"type": ..., "args": {...}}).
+
+    `standalone` output works outside the web app: images are resolved up front
+    and linked directly, and the stylesheet is inlined.
+    """
+    args = report_context["args"]
+    if standalone:
+        args = {**args, "defer_images": False, "proxy_images": False}
+        if not INLINE_REPORT_CSS:
+            yield f"<style>\n{REPORT_CSS}</style>\n"
+    yield from REPORT_ITERATORS[report_context["type"]](**args)
+
+def render_report(report_context, standalone=False):
+    """Build the whole report for a saved context as one string"""
+    return "".join(iter_report(report_context, standalone))
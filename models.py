@@ -1,14 +1,18 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
-if not os.getenv("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY is not set")
+# langchain_google_genai takes about a second to import, so it is only loaded
+# once a report actually needs a model; the key is checked at the same point
+def _chat_model(**kwargs):
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise ValueError("GOOGLE_API_KEY is not set")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(**kwargs)
 
-def get_supervisor_llm():   
-    supervisor_llm = ChatGoogleGenerativeAI(
+def get_supervisor_llm():
+    supervisor_llm = _chat_model(
         model="gemini-2.5-flash-preview-05-20",
         temperature=0.0,
         timeout=30,
@@ -17,13 +21,10 @@ def get_supervisor_llm():
     return supervisor_llm
 
 def get_formatter_llm():
-    formatter_llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-preview-05-20", 
+    formatter_llm = _chat_model(
+        model="gemini-2.5-flash-preview-05-20",
         temperature=0.0,
         timeout=30,
         max_retries=2
     )
     return formatter_llm
-
-
-
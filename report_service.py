@@ -0,0 +1,457 @@
+import os
+import time
+import uuid
+import asyncio
+from contextlib import aclosing
+from data_sources.census_api import STATE_FIPS, has_cached_census_data
+from data_sources.image_cache import count_cached_state_counties
+from utils import metrics
+from utils.admission import report_admission
+from utils.progress import stage_note
+from utils.single_flight import AsyncSingleFlight
+from utils.user_preferences import build_user_preferences
+
+REPORT_TIMEOUT_SECONDS = 600  # 10 minute timeout
+# Finished API jobs are kept this long for polling
+REPORT_JOB_TTL = int(os.getenv("REPORT_JOB_TTL", 3600))
+
+_agent = None
+
+async def setup_graph():
+    """Setup the USCensusAgent and workflow graph once"""
+    global _agent
+    if _agent is None:
+        # Imported lazily so callers that only read stored reports skip LangGraph and the LLM clients
+        from build_graph import USCensusAgent
+        print("🔧 Setting up USCensusAgent...")
+        _agent = USCensusAgent()
+        await _agent.setup_graph()
+        print("✅ USCensusAgent ready!")
+    return _agent.graph
+
+# Rough cost units for the report scheduler: every graph run makes LLM calls; a state
+# adds its census fetch when that is not in memory and image lookups for each shown
+# county that has none cached
+LLM_COST = 1.0
+CENSUS_COST = 1.0
+IMAGES_COST = 2.0
+SHOWN_COUNTIES = {1: 5, 2: 3}
+
+def estimate_report_cost(state_names):
+    """Expected cost of a graph run from cache probes; lower runs first when reports queue up"""
+    shown = SHOWN_COUNTIES.get(len(state_names), 5)
+    cost = LLM_COST
+    for name in state_names:
+        state_fips = STATE_FIPS.get(name)
+        if not state_fips:
+            continue
+        if not has_cached_census_data(state_fips):
+            cost += CENSUS_COST
+        # Which counties rank top isn't known yet; a state with several cached counties usually has its top ones
+        cached = min(count_cached_state_counties(state_fips), shown)
+        cost += IMAGES_COST * (shown - cached) / shown
+    return round(cost, 2)
+
+def build_report_query(state_names, income, family_size):
+    """Natural-language query kept in the message history for compatibility"""
+    if len(state_names) > 1:
+        query = f"Compare {state_names[0]} vs {state_names[1]} for real estate investment"
+    else:
+        query = f"Find me a good place to buy a house in {state_names[0]}"
+    
+    # Add family context
+    if family_size > 1:
+        query += f" for my family of {family_size}"
+    
+    # Add income context
+    if income >= 1000000:
+        query += f" with ${income:,} income"
+    elif income >= 1000:
+        query += f" with ${int(income / 1000)}k income"
+    else:
+        query += f" with ${income} income"
+    return query
+
+def build_report_input(state_names, income, family_size, lifestyle, priorities, stream_report=False):
+    """Graph input for a report on one state or a comparison of two. All structured, no NLP needed."""
+    from langchain_core.messages import HumanMessage
+
+    states = [
+        {"state_name": name, "fips_code": STATE_FIPS[name]}
+        for name in state_names if name in STATE_FIPS
+    ]
+    return {
+        "messages": [HumanMessage(content=build_report_query(state_names, income, family_size))],
+        "states": states,
+        "income": str(income),
+        "user_preferences": build_user_preferences(family_size, lifestyle, priorities),
+        "needs_followup": False,  # Skip all followup logic
+        "stream_report": stream_report
+    }
+
+async def run_report(report_input, timeout=REPORT_TIMEOUT_SECONDS):
+    """Run the report graph on a fresh thread and return its final state"""
+    graph = await setup_graph()
+    # Use unique thread ID to ensure fresh state
+    config = {"configurable": {"thread_id": f"report_{uuid.uuid4().hex[:8]}"}}
+    return await asyncio.wait_for(graph.ainvoke(report_input, config=config), timeout=timeout)
+
+# Progress bar position and status text for each graph node as it starts
+NODE_PROGRESS = {
+    "simple_routing": (0.15, "🧭 Planning the analysis..."),
+    "single_state_county_lookup": (0.2, "🤖 Choosing the county data to fetch..."),
+    "comparison_county_lookup": (0.2, "🤖 Choosing the county data to fetch..."),
+    "tools": (0.3, "🏘️ Fetching county data..."),
+    "summarize_single_state": (0.55, "📈 Scoring and ranking counties..."),
+    "summarize_comparison": (0.55, "📈 Scoring and ranking counties..."),
+    "insights_single_state": (0.6, "✍️ Writing insights..."),
+    "insights_comparison": (0.6, "✍️ Writing insights..."),
+    "assemble_single_state": (0.85, "📊 Assembling the report..."),
+    "assemble_comparison": (0.85, "📊 Assembling the report..."),
+}
+STAGE_LABELS = {"census": "🏘️ Census data", "images": "🖼️ Images"}
+STAGE_STATUS_TEXT = {"cached": "from cache", "fetched": "fetched", "deferred": "loading in the page"}
+# Streamed insight text between two progress updates
+LLM_PROGRESS_CHARACTERS = 200
+
+def describe_stage(note):
+    """Progress text for a census or image stage note"""
+    return f"{STAGE_LABELS[note['stage']]} for {note['name']}: {STAGE_STATUS_TEXT[note['status']]}"
+
+def _chunk_length(chunk):
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str):
+        return len(content)
+    return sum(len(part.get("text", "")) if isinstance(part, dict) else len(str(part)) for part in content)
+
+async def stream_report(report_input, stages):
+    """Run the report graph, turning its node and model events into ("progress", fraction,
+    description) and ("stage", note) events, and finish with ("result", graph_result).
+
+    `stages` is the run's StageLog, where census lookups note whether they hit the cache.
+    """
+    graph = await setup_graph()
+    config = {"configurable": {"thread_id": f"report_{uuid.uuid4().hex[:8]}"}}
+    fraction = 0.1
+    started = {}
+    streamed = reported = 0
+    async for event in graph.astream_events(report_input, config=config, version="v2"):
+        for note in stages.drain():
+            yield ("stage", note)
+            yield ("progress", fraction, describe_stage(note))
+        
+        kind, name = event["event"], event["name"]
+        # Nodes are direct children of the graph run; ToolNode's own "tools" chain sits below
+        if name in NODE_PROGRESS and len(event["parent_ids"]) == 1:
+            if kind == "on_chain_start":
+                started[name] = time.monotonic()
+                fraction, description = NODE_PROGRESS[name]
+                yield ("progress", fraction, description)
+            elif kind == "on_chain_end":
+                seconds = time.monotonic() - started.pop(name, time.monotonic())
+                yield ("stage", stage_note("node", name, "done", seconds=round(seconds, 2)))
+        elif kind == "on_chat_model_start":
+            streamed = reported = 0
+        elif kind == "on_chat_model_stream":
+            streamed += _chunk_length(event["data"]["chunk"])
+            if streamed - reported >= LLM_PROGRESS_CHARACTERS:
+                reported = streamed
+                # Creep towards the next node's position while the text comes in
+                yield ("progress", min(fraction + streamed / 10000, 0.8),
+                       f"✍️ Gemini is writing... {streamed:,} characters so far")
+        elif kind == "on_chat_model_end":
+            node = event["metadata"].get("langgraph_node")
+            yield ("stage", stage_note("llm", node, "generated", characters=streamed))
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            yield ("result", event["data"]["output"])
+
+def print_stage_timeline(notes):
+    """One log line per graph run showing where its time went and what came from cache"""
+    nodes = " · ".join(f"{note['name']} {note['seconds']:.2f}s" for note in notes if note["stage"] == "node")
+    census = ", ".join(f"{note['name']} {note['status']}" for note in notes if note["stage"] == "census")
+    print(f"⏱️ Report stages: {nodes}" + (f" | census: {census}" if census else ""))
+
+def stored_report_context(state_name, income, family_size, lifestyle, priorities):
+    """Pre-generated report context matching the inputs, shown with the user's own income, or None"""
+    from utils.report_store import load_report, normalize_report_inputs
+
+    report_context = load_report(normalize_report_inputs(state_name, income, family_size, lifestyle, priorities))
+    metrics.count_cache_lookup("report_store", bool(report_context))
+    if not report_context:
+        return None
+    return {**report_context, "args": {**report_context["args"], "income": f"{int(income):,}"}}
+
+# Graph runs in progress, keyed like the report cache so identical submissions share one
+report_flights = AsyncSingleFlight("reports")
+
+def report_flight_key(state_names, income, family_size, lifestyle, priorities):
+    from utils.report_cache import cache_key, normalize_cache_inputs
+    return cache_key(normalize_cache_inputs(state_names, income, family_size, lifestyle, priorities))
+
+async def cached_report_context(state_names, income, family_size, lifestyle, priorities):
+    """Report context from an earlier identical submission, or None"""
+    from utils.report_cache import get_cached_report, normalize_cache_inputs
+
+    inputs = normalize_cache_inputs(state_names, income, family_size, lifestyle, priorities)
+    return await asyncio.to_thread(get_cached_report, inputs)
+
+def is_complete_report(report_context):
+    """False for reports degraded by an outage (no counties, canned insights), which must not be kept"""
+    args = report_context["args"]
+    if report_context["type"] == "comparison":
+        has_counties = bool(args.get("counties1")) and bool(args.get("counties2"))
+    else:
+        has_counties = bool(args.get("counties"))
+    return has_counties and not report_context.get("insights_fallback")
+
+async def remember_report_context(state_names, income, family_size, lifestyle, priorities, report_context):
+    """Cache a finished report context so the same submission comes back without the graph"""
+    from utils.report_cache import cache_report, normalize_cache_inputs
+
+    if not is_complete_report(report_context):
+        print(f"⚠️ Not caching degraded report for {', '.join(state_names)}")
+        return
+    inputs = normalize_cache_inputs(state_names, income, family_size, lifestyle, priorities)
+    await asyncio.to_thread(cache_report, inputs, report_context)
+
+async def generate_report_context(state_names, income, family_size, lifestyle, priorities, run, session_id=None):
+    """Find or build the report for a request, cheapest source first: pre-generated store,
+    report cache, an identical run in progress, then a new graph run through admission.
+
+    Yields ("progress", fraction, description), ("queued", position) and ("stage", note)
+    events and ends with ("result", graph_result). Stage notes say which step ran and
+    whether it was served from a cache. Raises AdmissionRejected when the report can't be
+    queued and ReportCancelled when `run` is cancelled.
+    """
+    with metrics.timed(metrics.REPORTS, metrics.REPORT_SECONDS, source="graph") as labels:
+        # aclosing runs the inner generator's cleanup (admission, shared flight) when the caller stops early
+        async with aclosing(_find_or_build_report(
+            state_names, income, family_size, lifestyle, priorities, run, session_id, labels
+        )) as events:
+            async for event in events:
+                yield event
+
+async def _find_or_build_report(state_names, income, family_size, lifestyle, priorities, run, session_id, labels):
+    result = None
+    if len(state_names) == 1:
+        report_context = stored_report_context(state_names[0], income, family_size, lifestyle, priorities)
+        if report_context:
+            labels["source"] = "store"
+            yield ("stage", stage_note("report", state_names[0], "stored"))
+            yield ("progress", 0.9, "📊 Loading pre-generated report...")
+            result = {"report_context": report_context}
+    
+    # Identical earlier submissions come back from the report cache
+    if result is None:
+        report_context = await cached_report_context(state_names, income, family_size, lifestyle, priorities)
+        if report_context:
+            labels["source"] = "cache"
+            yield ("stage", stage_note("report", " vs ".join(state_names), "cached"))
+            yield ("progress", 0.9, "📊 Loading cached report...")
+            result = {"report_context": report_context}
+    
+    # The same report already being generated for someone else is awaited, not run again
+    flight_key = report_flight_key(state_names, income, family_size, lifestyle, priorities)
+    if result is None:
+        shared = report_flights.join(flight_key)
+        if shared is not None:
+            labels["source"] = "shared"
+            yield ("stage", stage_note("report", " vs ".join(state_names), "shared"))
+            yield ("progress", 0.4, "🤝 Joining an identical report already in progress...")
+            result = await run.guard(asyncio.shield(shared))
+    
+    if result is None:
+        flight = report_flights.lead(flight_key)
+        try:
+            # Only graph runs go through admission; cached and stored reports above skip the line.
+            # Reports whose census data and images are already cached finish quickly, so they go first
+            cost = await asyncio.to_thread(estimate_report_cost, state_names)
+            ticket = report_admission.enter(session_id, cost)
+            try:
+                position = report_admission.position(ticket)
+                while position:
+                    yield ("queued", position)
+                    position = await run.guard(report_admission.wait(ticket))
+                metrics.REPORT_QUEUE_SECONDS.observe(time.monotonic() - ticket.queued_at)
+                
+                yield ("progress", 0.1, "🔧 Setting up analysis engine...")
+                await setup_graph()
+                
+                # The caller renders the sections from report_context as it needs them
+                report_input = build_report_input(state_names, income, family_size, lifestyle, priorities, stream_report=True)
+                notes = []
+                deadline = time.monotonic() + REPORT_TIMEOUT_SECONDS
+                async with aclosing(stream_report(report_input, run.stages)) as stream:
+                    while True:
+                        # Each step is awaited through the run, so a superseded report stops mid-graph
+                        event = await run.guard(asyncio.wait_for(anext(stream, None), deadline - time.monotonic()))
+                        if event is None:
+                            break
+                        if event[0] == "result":
+                            result = event[1]
+                            continue
+                        if event[0] == "stage":
+                            notes.append(event[1])
+                        yield event
+                print_stage_timeline(notes)
+            finally:
+                report_admission.release(ticket)
+        finally:
+            # Requests that joined get the result, or None to run the report themselves
+            report_flights.settle(flight_key, flight, result)
+        
+        if result.get("report_context"):
+            await remember_report_context(
+                state_names, income, family_size, lifestyle, priorities, result["report_context"]
+            )
+        yield ("progress", 0.9, "📊 Generating final report...")
+    
+    yield ("result", result)
+
+async def obtain_report_context(state_names, income, family_size, lifestyle, priorities, run=None, on_event=None):
+    """Run generate_report_context to the end and return the report context, or None if it failed.
+
+    `on_event` sees every progress, queue and stage event. Raises AdmissionRejected,
+    ReportCancelled and asyncio.TimeoutError like generate_report_context.
+    """
+    from utils.cancellation import ReportRun
+
+    run = run or ReportRun(None)
+    result = None
+    async with aclosing(generate_report_context(
+        state_names, income, family_size, lifestyle, priorities, run, run.session_id
+    )) as events:
+        async for event in events:
+            if event[0] == "result":
+                result = event[1]
+            elif on_event:
+                on_event(event)
+    return (result or {}).get("report_context")
+
+# Report jobs submitted over the HTTP API, by job id
+_report_jobs = {}
+
+def submit_report_job(state_names, income, family_size, lifestyle, priorities, output):
+    """Start a report in the background and return its job record for polling"""
+    from utils.cancellation import ReportRun
+
+    prune_report_jobs()
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "position": None,
+        "progress": 0.0,
+        "message": "Waiting to start",
+        "created_at": time.time(),
+        "finished_at": None,
+        "error": None,
+        "result": None,
+        "stages": [],
+        "run": ReportRun(None),
+    }
+    job["task"] = asyncio.ensure_future(_run_report_job(job, state_names, income, family_size, lifestyle, priorities, output))
+    _report_jobs[job["id"]] = job
+    return job
+
+async def _run_report_job(job, state_names, income, family_size, lifestyle, priorities, output):
+    from utils.admission import AdmissionRejected
+    from utils.cancellation import ReportCancelled
+
+    def on_event(event):
+        if event[0] == "queued":
+            job.update(status="queued", position=event[1], message=f"#{event[1]} in line")
+        elif event[0] == "stage":
+            job["stages"].append(event[1])
+        else:
+            job.update(status="running", position=None, progress=event[1], message=event[2])
+
+    try:
+        report_context = await obtain_report_context(
+            state_names, income, family_size, lifestyle, priorities, job["run"], on_event
+        )
+        if report_context:
+            job["result"] = await asyncio.to_thread(render_report_output, report_context, output)
+            job.update(status="done", progress=1.0, message="Report completed")
+        else:
+            job.update(status="failed", error="Unable to generate a report with these parameters")
+    except AdmissionRejected as e:
+        job.update(status="rejected", error=str(e))
+    except ReportCancelled:
+        job.update(status="cancelled", error="Cancelled")
+    except asyncio.TimeoutError:
+        job.update(status="failed", error=f"Report generation timed out after {REPORT_TIMEOUT_SECONDS} seconds")
+    except Exception as e:
+        print(f"❌ Report job {job['id']} failed: {e}")
+        job.update(status="failed", error=str(e))
+    finally:
+        job["finished_at"] = time.time()
+
+def render_report_output(report_context, output="json"):
+    """The compact JSON payload or the full HTML for a report context"""
+    if output == "html":
+        from html_formatting import render_report
+        # API clients have neither report.js, report.css nor the image proxy
+        return {"html": render_report(report_context, standalone=True)}
+    from utils.report_payload import build_report_payload
+    return {"report": build_report_payload(report_context)}
+
+def get_report_job(job_id):
+    return _report_jobs.get(job_id)
+
+def cancel_report_job(job_id):
+    job = _report_jobs.get(job_id)
+    if job and job["finished_at"] is None:
+        job["run"].cancel()
+    return job
+
+def prune_report_jobs():
+    """Forget finished jobs older than REPORT_JOB_TTL"""
+    cutoff = time.time() - REPORT_JOB_TTL
+    for job_id in [job_id for job_id, job in _report_jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+        del _report_jobs[job_id]
+
+async def pregenerate_reports(states=None, tiers=None, family_sizes=None, overwrite=False, verbose=True):
+    """Render every single-state combination of tier, lifestyle and priority into the report store"""
+    from html_formatting import render_report
+    from utils.report_store import TIER_INCOMES, has_report, normalize_report_inputs, save_report
+    from utils.user_preferences import DEFAULT_FAMILY_SIZE, LIFESTYLE_CHOICES, PRIORITY_CHOICES
+
+    totals = {"generated": 0, "already_stored": 0, "failed": 0}
+    for state_name in states or list(STATE_FIPS):
+        stats = {"generated": 0, "already_stored": 0, "failed": 0}
+        for tier in tiers or list(TIER_INCOMES):
+            income = TIER_INCOMES[tier]
+            for family_size in family_sizes or [DEFAULT_FAMILY_SIZE]:
+                for lifestyle in LIFESTYLE_CHOICES:
+                    for priorities in PRIORITY_CHOICES:
+                        inputs = normalize_report_inputs(state_name, income, family_size, lifestyle, priorities)
+                        if not overwrite and has_report(inputs):
+                            stats["already_stored"] += 1
+                            continue
+                        
+                        try:
+                            result = await run_report(build_report_input(
+                                [state_name], income, family_size, lifestyle, priorities, stream_report=True
+                            ))
+                        except Exception as e:
+                            print(f"❌ {state_name} / {tier} / {lifestyle} / {priorities}: {e}")
+                            stats["failed"] += 1
+                            continue
+                        
+                        report_context = result.get("report_context")
+                        # A degraded report would be served for every matching request until overwritten
+                        if not report_context or not is_complete_report(report_context):
+                            stats["failed"] += 1
+                            continue
+                        
+                        # Resolve the county images now so serving the report never waits on an image API
+                        warm_context = {**report_context, "args": {**report_context["args"], "defer_images": False}}
+                        await asyncio.to_thread(render_report, warm_context)
+                        save_report(inputs, report_context)
+                        stats["generated"] += 1
+        
+        for key, value in stats.items():
+            totals[key] += value
+        if verbose:
+            print(f"📄 {state_name}: {stats['generated']} generated, {stats['already_stored']} stored, {stats['failed']} failed")
+    return totals
@@ -0,0 +1,27 @@
+from data_sources.census_api import STATE_FIPS
+from scoring.county_scoring import calculate_state_medians
+from scoring.filtering import process_counties_with_tagging
+from utils.user_preferences import parse_user_priority
+
+def rank_state_counties(state_name, income, user_preferences="", state_fips=None):
+    """Score and rank a state's counties the way the report does, without the LLM or any HTML.
+
+    Returns {"state_name", "income", "counties": [...]} or {"error": ...}.
+    """
+    # Imported here so scoring stays usable without the tool module's image dependencies
+    from tools import real_estate_investment_tool
+
+    state_fips = state_fips or STATE_FIPS.get(state_name)
+    if not state_fips:
+        return {"error": f"Unknown state: {state_name}"}
+
+    tool_output = real_estate_investment_tool(state_fips, state_name)
+    if tool_output.get("error"):
+        return {"error": tool_output["error"]}
+
+    counties = tool_output.get("data", {}).get(state_name, {}).get("data", [])
+    user_budget = int(income)
+    ranked = process_counties_with_tagging(
+        counties, parse_user_priority(user_preferences), calculate_state_medians(counties), user_budget, state_name
+    )
+    return {"state_name": state_name, "income": user_budget, "counties": ranked}
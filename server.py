@@ -0,0 +1,18 @@
+import os
+import gradio as gr
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from api import exports, images, metrics, rankings, reports
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+def create_app(demo):
+    """Serve the Gradio interface and the HTTP routes from one FastAPI app"""
+    app = FastAPI(title="FamilyHomeFinder")
+    app.include_router(images.router)
+    app.include_router(exports.router)
+    app.include_router(rankings.router)
+    app.include_router(reports.router)
+    app.include_router(metrics.router)
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+    return gr.mount_gradio_app(app, demo, path="/")
@@ -0,0 +1,99 @@
+// Pages in the counties ranked below a report's cards from /api/rankings, one page
+// at a time as the table scrolls into view, so long rankings never render all at once.
+(function () {
+  var PAGE_SIZE = 10;
+
+  function esc(value) {
+    return String(value == null ? "" : value)
+      .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+      .replace(/"/g, "&quot;").replace(/'/g, "&#39;");
+  }
+
+  function number(value, prefix) {
+    return value == null ? "—" : (prefix || "") + Number(value).toLocaleString("en-US");
+  }
+
+  function row(item) {
+    var score = item.final_score == null ? "—" : Number(item.final_score).toFixed(1);
+    return "<tr><td>" + item.rank + "</td><td>" + esc(item.county) + "</td><td>" + score + "</td><td>" +
+      number(item.median_home_value, "$") + "</td><td>" + number(item.median_household_income, "$") + "</td><td>" +
+      number(item.population) + "</td></tr>";
+  }
+
+  function setup(table) {
+    if (table.dataset.rankingReady) {
+      return;
+    }
+    table.dataset.rankingReady = "1";
+
+    var section = table.closest(".ranking-section");
+    var button = section.querySelector(".ranking-load-more");
+    var body = table.querySelector("tbody");
+    var offset = Number(table.dataset.offset);
+    var total = Number(table.dataset.total);
+    var loading = false;
+    var observer = null;
+
+    function finish(message) {
+      if (observer) {
+        observer.disconnect();
+      }
+      if (message) {
+        button.textContent = message;
+        button.disabled = true;
+      } else {
+        button.remove();
+      }
+    }
+
+    function loadPage() {
+      if (loading || offset >= total) {
+        return;
+      }
+      loading = true;
+      button.disabled = true;
+
+      var params = new URLSearchParams({ offset: offset, limit: PAGE_SIZE });
+      fetch("/api/rankings/" + encodeURIComponent(table.dataset.rankingId) + "?" + params.toString())
+        .then(function (response) {
+          if (!response.ok) {
+            throw new Error(response.status === 404 ? "Ranking expired, run the report again" : "Could not load counties");
+          }
+          return response.json();
+        })
+        .then(function (page) {
+          body.insertAdjacentHTML("beforeend", page.items.map(row).join(""));
+          offset += page.items.length;
+          total = page.total;
+          loading = false;
+          if (offset >= total || !page.items.length) {
+            finish();
+          } else {
+            button.disabled = false;
+          }
+        })
+        .catch(function (error) {
+          loading = false;
+          finish(error.message);
+        });
+    }
+
+    button.addEventListener("click", loadPage);
+    // Load the next page once the button scrolls into view; the button stays as a fallback
+    if ("IntersectionObserver" in window) {
+      observer = new IntersectionObserver(function (entries) {
+        if (entries.some(function (entry) { return entry.isIntersecting; })) {
+          loadPage();
+        }
+      });
+      observer.observe(button);
+    }
+  }
+
+  function scan() {
+    document.querySelectorAll(".ranking-table[data-ranking-id]").forEach(setup);
+  }
+
+  new MutationObserver(scan).observe(document.documentElement, { childList: true, subtree: true });
+  document.addEventListener("DOMContentLoaded", scan);
+})();
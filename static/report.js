@@ -0,0 +1,26 @@
+// Fills in county image slots that reports render as placeholders, so a report
+// can be shown before any image API has answered.
+(function () {
+  function hydrate(slot) {
+    if (slot.dataset.hydrating) {
+      return;
+    }
+    slot.dataset.hydrating = "1";
+
+    // The server looks up the county's name and seat from the FIPS code itself
+    fetch("/images/county/" + encodeURIComponent(slot.dataset.countyFips))
+      .then(function (response) { return response.ok ? response.json() : { html: "" }; })
+      .catch(function () { return { html: "" }; })
+      .then(function (data) {
+        slot.innerHTML = data.html;
+        slot.classList.remove("county-images-pending");
+      });
+  }
+
+  function scan() {
+    document.querySelectorAll(".county-images-pending[data-county-fips]").forEach(hydrate);
+  }
+
+  new MutationObserver(scan).observe(document.documentElement, { childList: true, subtree: true });
+  document.addEventListener("DOMContentLoaded", scan);
+})();
@@ -0,0 +1,201 @@
+// Builds reports on the page from the compact JSON payload (utils/report_payload.py),
+// so the server only ships data. The markup comes from templates/, which the page head
+// carries as JSON (report_templates_html), so there is one copy shared with html_formatting.py.
+(function () {
+  var PLACEHOLDER_COUNT = 3;
+  var templates = null;
+
+  function esc(value) {
+    return String(value == null ? "" : value)
+      .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+      .replace(/"/g, "&quot;").replace(/'/g, "&#39;");
+  }
+
+  function money(value) {
+    return "$" + Number(value || 0).toLocaleString("en-US");
+  }
+
+  // Same syntax as Python's string.Template: $name, ${name} and $$ for a literal dollar sign
+  function fill(name, values) {
+    templates = templates || JSON.parse(document.getElementById("report-templates").textContent);
+    return templates[name].replace(/\$(?:(\$)|([_a-z][_a-z0-9]*)|\{([_a-z][_a-z0-9]*)\})/gi,
+      function (match, dollar, named, braced) {
+        if (dollar) {
+          return "$";
+        }
+        var key = named || braced;
+        if (!(key in values)) {
+          throw new Error("Template " + name + " needs " + key);
+        }
+        return values[key];
+      });
+  }
+
+  function images(county, proxy) {
+    if (!county.images) {
+      // Not cached when the payload was built; report.js fills these in
+      return fill("county_images_pending", {
+        county_fips: esc(county.fips),
+        placeholders: new Array(PLACEHOLDER_COUNT + 1).join(fill("county_image_placeholder", {}))
+      });
+    }
+    var tags = county.images.map(function (ref) {
+      if (!proxy) {
+        return fill("county_image", { src: esc(ref), alt: esc(county.name) });
+      }
+      function srcset(ext) {
+        return proxy.widths.map(function (width) {
+          return proxy.prefix + "/" + ref + "/" + width + "." + ext + " " + width + "w";
+        }).join(", ");
+      }
+      return fill("county_image_proxied", {
+        src: proxy.prefix + "/" + ref + "/" + proxy.default_width + ".jpg",
+        webp_srcset: srcset("webp"),
+        jpg_srcset: srcset("jpg"),
+        alt: esc(county.name)
+      });
+    });
+    return fill("county_images", { images: tags.join("") });
+  }
+
+  function statItem(label, value, extraClass) {
+    return fill("stat_item", { extra_class: extraClass ? " " + esc(extraClass) : "", label: label, value: esc(value) });
+  }
+
+  function countyCard(county, rank, proxy) {
+    var safety = county.safety;
+    var stats = [
+      statItem("Median Home Value", money(county.home_value)),
+      statItem("Household Income", money(county.income)),
+      statItem("Population", Number(county.population || 0).toLocaleString("en-US")),
+      statItem("Homeownership Rate", county.homeownership),
+      statItem("College Degree Rate", county.college_rate + "%")
+    ];
+    if (safety) {
+      stats.push(statItem("Safety Score", safety.score, safety.color_class));
+    }
+    var body = fill("county_card_body", {
+      county_name: esc(county.name),
+      safety_badge: safety ? fill("safety_badge", { badge_class: esc(safety.badge_class), tier: esc(safety.tier) }) : "",
+      images: images(county, proxy),
+      stats: stats.join(""),
+      notable_feature: esc(county.feature),
+      safety_rating: safety ? fill("safety_rating", { rating: esc(safety.rating) }) : ""
+    });
+    return fill("county_card", { rank: rank, body: body });
+  }
+
+  function quickStat(label, value, extraClass) {
+    return fill("quick_stat", { extra_class: extraClass ? " " + esc(extraClass) : "", label: label, value: esc(value) });
+  }
+
+  function quickStats(county) {
+    var values = county
+      ? [["Home Value", money(county.home_value)], ["Income", money(county.income)], ["Homeownership", county.homeownership]]
+      : [["Home Value", "—"], ["Income", "—"], ["Homeownership", "—"]];
+    var html = values.map(function (item) {
+      return quickStat(item[0], item[1]);
+    });
+    if (county && county.safety) {
+      html.push(quickStat("Safety Score", county.safety.score, "safety-score-display " + county.safety.color_class));
+    }
+    return html.join("");
+  }
+
+  function comparisonRows(first, second) {
+    var rows = [];
+    var count = Math.max(first.counties.length, second.counties.length);
+    for (var i = 0; i < count; i++) {
+      var a = first.counties[i];
+      var b = second.counties[i];
+      rows.push(fill("comparison_row", {
+        rank: i + 1,
+        name1: esc(first.name),
+        name2: esc(second.name),
+        county1: esc(a ? a.name : "—"),
+        county2: esc(b ? b.name : "—"),
+        stats1: quickStats(a),
+        stats2: quickStats(b)
+      }));
+    }
+    return rows.join(fill("vs_divider", {}));
+  }
+
+  function cards(state, proxy) {
+    return state.counties.map(function (county, index) {
+      return countyCard(county, index + 1, proxy);
+    }).join("");
+  }
+
+  // ranking_table.js loads the rows
+  function rankingSection(state) {
+    var ranking = state.ranking;
+    if (!ranking) {
+      return "";
+    }
+    return fill("ranking_table", {
+      state_name: esc(state.name),
+      ranking_id: esc(ranking.id),
+      shown: ranking.shown,
+      remaining: ranking.total - ranking.shown,
+      total: ranking.total
+    });
+  }
+
+  // The insights arrive as HTML, converted on the server with the report's own fallbacks
+  function insights(title, payload) {
+    return fill("insights_section", {
+      title: title,
+      insights: payload.insights_html,
+      recommendation: payload.recommendation_html
+    });
+  }
+
+  function renderReport(payload) {
+    var proxy = payload.image_proxy;
+    var states = payload.states;
+    if (payload.type === "single_state") {
+      var state = states[0];
+      return fill("single_state_header", {
+        stylesheet: "",
+        state_name: esc(state.name),
+        income: esc(payload.income),
+        date: esc(payload.date)
+      }) + cards(state, proxy) + rankingSection(state) +
+        insights("💡 Key Insights", payload) + fill("report_footer", {});
+    }
+    return fill("comparison_header", {
+      stylesheet: "",
+      name1: esc(states[0].name),
+      name2: esc(states[1].name),
+      income: esc(payload.income),
+      date: esc(payload.date)
+    }) + comparisonRows(states[0], states[1]) +
+      fill("counties_heading", { icon: "🏆", state_name: esc(states[0].name) }) + cards(states[0], proxy) +
+      rankingSection(states[0]) +
+      fill("counties_heading", { icon: "🌟", state_name: esc(states[1].name) }) + cards(states[1], proxy) +
+      rankingSection(states[1]) +
+      insights("💡 Key Takeaways", payload) + fill("report_footer", {});
+  }
+
+  function render(root) {
+    if (root.dataset.rendered) {
+      return;
+    }
+    root.dataset.rendered = "1";
+    try {
+      root.innerHTML = renderReport(JSON.parse(root.querySelector("script.report-json-payload").textContent));
+    } catch (error) {
+      root.innerHTML = '<p class="report-json-error">Could not display this report.</p>';
+      console.error("Report rendering failed", error);
+    }
+  }
+
+  function scan() {
+    document.querySelectorAll(".report-json-root").forEach(render);
+  }
+
+  window.renderReportPayload = renderReport;
+  new MutationObserver(scan).observe(document.documentElement, { childList: true, subtree: true });
+  document.addEventListener("DOMContentLoaded", scan);
+})();
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 # Import from new modular structure
 from data_sources.census_api import get_census_data
 from data_sources.image_apis import get_county_images
+from data_sources.county_seats import get_county_seat
 from scoring.county_scoring import calculate_state_medians
 from scoring.filtering import process_counties_with_tagging
 from utils.user_preferences import parse_user_priority
@@ -66,6 +67,10 @@ def real_estate_investment_tool(state_fips: str, state_name: str, comparison_sta
                 county_name = county_name.split(",")[0].strip()
             processed_data["name"] = county_name
             
+            # Full 5-digit county FIPS code, used as a stable cache key
+            processed_data["fips"] = f"{processed_data.get('state', '')}{processed_data.get('county', '')}"
+            processed_data["county_seat"] = get_county_seat(processed_data["fips"], county_name, state_name)
+            
             # Add college degree rate
             from scoring.county_scoring import calculate_college_degree_rate
             processed_data['college_degree_rate'] = calculate_college_degree_rate(processed_data)
@@ -0,0 +1,129 @@
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+# Graph runs allowed at once, how many more may wait for a slot, and how many
+# one browser session may have running or waiting
+MAX_CONCURRENT_REPORTS = int(os.getenv("MAX_CONCURRENT_REPORTS", 4))
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", 16))
+MAX_REPORTS_PER_SESSION = int(os.getenv("MAX_REPORTS_PER_SESSION", 1))
+# Waiting this long takes one unit off a queued report's cost, so expensive
+# reports move up over time instead of being starved by a stream of cheap ones
+REPORT_AGING_SECONDS = float(os.getenv("REPORT_AGING_SECONDS", 20))
+
+class AdmissionRejected(Exception):
+    """Raised when a report cannot be queued: the queue is full or the session is at its limit"""
+
+class AdmissionTicket:
+    """One report's place in line; `changed` is set whenever it is admitted or the queue moves"""
+
+    def __init__(self, session_id, cost=0.0):
+        self.session_id = session_id
+        self.cost = cost
+        self.queued_at = time.monotonic()
+        self.admitted = False
+        self.changed = asyncio.Event()
+
+class ReportAdmission:
+    """Bounded queue in front of report generation, with a per-session cap.
+
+    Queued reports are served cheapest first by estimated cost, minus one unit
+    for every REPORT_AGING_SECONDS spent waiting. Runs on the web server's
+    event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_active=MAX_CONCURRENT_REPORTS, max_queued=REPORT_QUEUE_SIZE,
+                 per_session=MAX_REPORTS_PER_SESSION, aging_seconds=REPORT_AGING_SECONDS):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.per_session = per_session
+        self.aging_seconds = aging_seconds
+        self.active = 0
+        self.waiting = []
+        self.sessions = {}
+        self.counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_session_limit": 0}
+
+    def enter(self, session_id=None, cost=0.0):
+        """Admit straight away, queue, or raise AdmissionRejected without waiting"""
+        if session_id and self.sessions.get(session_id, 0) >= self.per_session:
+            self.counters["rejected_session_limit"] += 1
+            raise AdmissionRejected("You already have a report in progress. Please wait for it to finish.")
+
+        ticket = AdmissionTicket(session_id, cost)
+        if self.active < self.max_active and not self.waiting:
+            self._admit(ticket)
+        elif len(self.waiting) < self.max_queued:
+            self.waiting.append(ticket)
+            self.counters["queued"] += 1
+            # A cheap arrival can move ahead of reports already waiting
+            self._notify_waiting()
+        else:
+            self.counters["rejected_queue_full"] += 1
+            raise AdmissionRejected("The report queue is full right now. Please try again in a few minutes.")
+
+        if session_id:
+            self.sessions[session_id] = self.sessions.get(session_id, 0) + 1
+        return ticket
+
+    def priority(self, ticket, now=None):
+        """Effective cost of a queued ticket; the lowest is admitted next"""
+        waited = (now or time.monotonic()) - ticket.queued_at
+        return ticket.cost - waited / self.aging_seconds
+
+    def _ordered(self):
+        now = time.monotonic()
+        return sorted(self.waiting, key=lambda ticket: (self.priority(ticket, now), ticket.queued_at))
+
+    def position(self, ticket):
+        """1-based place in the queue, or 0 once admitted"""
+        return 0 if ticket.admitted else self._ordered().index(ticket) + 1
+
+    async def wait(self, ticket):
+        """Wait until the ticket is admitted or moves up; returns its new position"""
+        if not ticket.admitted:
+            await ticket.changed.wait()
+            ticket.changed.clear()
+        return self.position(ticket)
+
+    def release(self, ticket):
+        """Free the ticket's slot or queue place (also on cancellation) and move the queue along"""
+        if ticket.session_id:
+            remaining = self.sessions.get(ticket.session_id, 1) - 1
+            if remaining > 0:
+                self.sessions[ticket.session_id] = remaining
+            else:
+                self.sessions.pop(ticket.session_id, None)
+
+        if ticket.admitted:
+            self.active -= 1
+        elif ticket in self.waiting:
+            self.waiting.remove(ticket)
+
+        while self.active < self.max_active and self.waiting:
+            next_ticket = self._ordered()[0]
+            self.waiting.remove(next_ticket)
+            self._admit(next_ticket)
+        self._notify_waiting()
+
+    def _notify_waiting(self):
+        for waiting_ticket in self.waiting:
+            waiting_ticket.changed.set()
+
+    def _admit(self, ticket):
+        ticket.admitted = True
+        self.active += 1
+        self.counters["admitted"] += 1
+        ticket.changed.set()
+
+    def metrics(self):
+        return {
+            **self.counters,
+            "active": self.active,
+            "waiting": len(self.waiting),
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+        }
+
+report_admission = ReportAdmission()
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import contextvars
+from utils.progress import StageLog, current_stage_log
+
+class ReportCancelled(Exception):
+    """Raised inside a report run that was superseded by a newer one from the same session"""
+
+# Set for the duration of a report run; LangGraph and asyncio.to_thread copy the
+# context into worker threads, so blocking census and image code can check it too
+current_cancel_event = contextvars.ContextVar("current_cancel_event", default=None)
+
+def raise_if_cancelled():
+    """Stop before starting more work for a run that nobody is waiting for any more"""
+    event = current_cancel_event.get()
+    if event is not None and event.is_set():
+        raise ReportCancelled("Report was superseded by a newer request")
+
+def is_cancelled():
+    event = current_cancel_event.get()
+    return event is not None and event.is_set()
+
+class ReportRun:
+    """One report request; cancel() aborts whatever it is awaiting and flags its worker threads.
+
+    Work awaited through guard() can also note its stages in `stages`.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.cancel_event = threading.Event()
+        self.stages = StageLog()
+        self.finished = asyncio.Event()
+        self.task = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    async def _run(self, awaitable):
+        current_cancel_event.set(self.cancel_event)
+        current_stage_log.set(self.stages)
+        return await awaitable
+
+    async def guard(self, awaitable):
+        """Await in a task this run can cancel; raises ReportCancelled once superseded"""
+        if self.cancelled:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise ReportCancelled("Report was superseded by a newer request")
+        self.task = asyncio.ensure_future(self._run(awaitable))
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise ReportCancelled("Report was superseded by a newer request")
+            raise
+        finally:
+            self.task = None
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.task is not None:
+            self.task.cancel()
+
+class SessionRuns:
+    """Latest report run per browser session; starting a new one cancels the one before it"""
+
+    def __init__(self):
+        self.runs = {}
+        self.counters = {"started": 0, "superseded": 0}
+
+    async def start(self, session_id, wait=5.0):
+        run = ReportRun(session_id)
+        self.counters["started"] += 1
+        if not session_id:
+            return run
+
+        previous = self.runs.get(session_id)
+        self.runs[session_id] = run
+        if previous is not None and not previous.finished.is_set():
+            self.counters["superseded"] += 1
+            previous.cancel()
+            # Let it give back its queue place and slot before this run asks for one
+            try:
+                await asyncio.wait_for(previous.finished.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        return run
+
+    def finish(self, run):
+        run.finished.set()
+        if run.session_id and self.runs.get(run.session_id) is run:
+            del self.runs[run.session_id]
+
+    def metrics(self):
+        return {**self.counters, "active": len(self.runs)}
+
+session_runs = SessionRuns()
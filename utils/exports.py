@@ -0,0 +1,82 @@
+import io
+import csv
+import json
+import importlib.util
+
+# Raw ACS variables carried into exports, with readable column names
+ACS_EXPORT_COLUMNS = {
+    "B01003_001E": "population",
+    "B19013_001E": "median_household_income",
+    "B25077_001E": "median_home_value",
+    "B25003_001E": "occupied_housing_units",
+    "B25003_002E": "owner_occupied_units",
+    "B11005_002E": "households_with_children",
+    "B15003_001E": "population_25_plus",
+    "B15003_022E": "bachelors_degree",
+    "B15003_023E": "masters_degree",
+    "B15003_024E": "professional_degree",
+    "B15003_025E": "doctorate_degree",
+}
+
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# pandas writes Parquet through either of these; neither is in requirements.txt
+PARQUET_ENGINES = ("pyarrow", "fastparquet")
+
+def parquet_available():
+    """True if a Parquet engine is installed, so callers can fail before doing any work"""
+    return any(importlib.util.find_spec(engine) for engine in PARQUET_ENGINES)
+
+def ranking_rows(counties, state_name=None, start=1):
+    """Flatten ranked counties into one dict per county: rank, identity, scores, tags and ACS metrics"""
+    rows = []
+    for rank, county in enumerate(counties, start):
+        row = {
+            "rank": rank,
+            "fips": county.get("fips"),
+            "county": county.get("name"),
+            "state": state_name,
+            "county_seat": county.get("county_seat"),
+            "final_score": county.get("final_score"),
+            "tier": county.get("tier"),
+        }
+        for dimension, score in county.get("scores", {}).items():
+            row[f"score_{dimension}"] = score
+        for tag, value in county.get("tags", {}).items():
+            row[f"tag_{tag}"] = value
+        for variable, column in ACS_EXPORT_COLUMNS.items():
+            row[column] = county.get(variable)
+        row["college_degree_rate"] = county.get("college_degree_rate")
+        rows.append(row)
+    return rows
+
+def export_rankings(counties, fmt="json", state_name=None):
+    """Serialize ranked counties as JSON, CSV or Parquet. Returns bytes."""
+    rows = ranking_rows(counties, state_name)
+
+    if fmt == "json":
+        return json.dumps(rows, indent=2).encode("utf-8")
+
+    if fmt == "csv":
+        output = io.StringIO()
+        fieldnames = list(rows[0]) if rows else ["rank", "fips", "county", "state"]
+        # Tags and scores can differ between counties, so collect every column
+        for row in rows[1:]:
+            fieldnames.extend(key for key in row if key not in fieldnames)
+        writer = csv.DictWriter(output, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue().encode("utf-8")
+
+    if fmt == "parquet":
+        # pandas is already a dependency; writing Parquet also needs pyarrow or fastparquet
+        import pandas as pd
+        output = io.BytesIO()
+        pd.DataFrame(rows).to_parquet(output, index=False)
+        return output.getvalue()
+
+    raise ValueError(f"Unsupported export format: {fmt}")
@@ -0,0 +1,56 @@
+import re
+import sys
+import time
+import subprocess
+from collections import defaultdict
+
+IMPORT_PROFILE_FLAG = "--import-profile"
+
+# Only needed once a report is generated or exported; the web app must start without them
+STARTUP_LAZY_MODULES = ("langgraph", "langchain_core", "langchain_google_genai", "pandas", "markdown")
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+def import_profile_requested():
+    """True in the process that should report; False in the -X importtime child it starts"""
+    return IMPORT_PROFILE_FLAG in sys.argv and "importtime" not in sys._xoptions
+
+def profile_imports(script, lazy_modules=(), top=15):
+    """Re-run `script` under `python -X importtime` and print where its import time went.
+
+    The child sees --import-profile too, so the script decides when its startup
+    is over. Returns an exit code: non-zero if the child failed or any of
+    `lazy_modules` was imported.
+    """
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, "-X", "importtime", script, *sys.argv[1:]],
+                           stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - started
+
+    by_package = defaultdict(int)
+    imported = set()
+    total = 0
+    for line in child.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            if not line.startswith("import time:"):
+                print(line, file=sys.stderr)
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        package = module.split(".")[0]
+        by_package[package] += int(self_us)
+        imported.add(package)
+        if not indent:
+            total += int(cumulative_us)
+
+    print(f"\n⏱️ Startup took {wall:.2f} s, {total / 1e6:.2f} s of it importing {len(imported)} packages")
+    print(f"{'package':<28} {'self':>8} {'share':>6}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        share = self_us / total if total else 0.0
+        print(f"{package:<28} {self_us / 1e6:>7.3f}s {share:>6.0%}")
+
+    eager = [module for module in lazy_modules if module in imported]
+    if eager:
+        print(f"⚠️ Imported at startup but meant to load on first use: {', '.join(eager)}")
+        return child.returncode or 1
+    return child.returncode
@@ -0,0 +1,196 @@
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from utils.admission import AdmissionRejected
+from utils.cancellation import ReportCancelled
+
+METRIC_PREFIX = "homefinder_"
+
+# Histogram upper bounds in seconds, from cache hits up to full Gemini calls and graph runs
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = METRIC_PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, dict(zip(self.labels, key)), value) for key, value in self.values.items()]
+
+class Histogram:
+    """Bucketed observations per label combination, exported as cumulative buckets, sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = METRIC_PREFIX + name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, series in self.values.items():
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    samples.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, count))
+                samples.append((self.name + "_bucket", {**labels, "le": "+Inf"}, series["count"]))
+                samples.append((self.name + "_sum", labels, series["sum"]))
+                samples.append((self.name + "_count", labels, series["count"]))
+        return samples
+
+class Registry:
+    """Metrics recorded as things happen, plus collectors that read existing counters at scrape time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """`collect()` returns (name, kind, help, [(labels, value), ...]) tuples; names get the prefix"""
+        self.collectors.append(collect)
+        return collect
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(_format_sample(name, labels, value) for name, labels, value in metric.samples())
+        for collect in self.collectors:
+            for name, kind, help_text, samples in collect():
+                name = METRIC_PREFIX + name
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_format_sample(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_sample(name, labels, value):
+    if not labels:
+        return f"{name} {_format_value(value)}"
+    pairs = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+    return f"{name}{{{pairs}}} {_format_value(value)}"
+
+registry = Registry()
+
+GRAPH_NODE_RUNS = registry.counter(
+    "graph_node_runs_total", "Report graph node executions by outcome", ("node", "outcome"))
+GRAPH_NODE_SECONDS = registry.histogram(
+    "graph_node_duration_seconds", "Time spent in each report graph node", ("node",))
+EXTERNAL_REQUESTS = registry.counter(
+    "external_requests_total", "Calls to external APIs by provider and outcome", ("provider", "outcome"))
+EXTERNAL_SECONDS = registry.histogram(
+    "external_request_duration_seconds", "External API latency, excluding time waiting for a slot", ("provider",))
+CACHE_LOOKUPS = registry.counter(
+    "cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ("cache", "result"))
+REPORTS = registry.counter(
+    "reports_total", "Report requests by where the report came from and outcome", ("source", "outcome"))
+REPORT_SECONDS = registry.histogram(
+    "report_duration_seconds", "Time to produce a report context, including queueing", ("source",))
+REPORT_QUEUE_SECONDS = registry.histogram(
+    "report_queue_wait_seconds", "Time graph runs waited for an admission slot")
+
+def error_outcome(error):
+    """Short, low-cardinality label for why a call ended early"""
+    if isinstance(error, (ReportCancelled, asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(error, AdmissionRejected):
+        return "rejected"
+    if "Timeout" in type(error).__name__:
+        return "timeout"
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return f"http_{status}"
+    return "error"
+
+@contextmanager
+def timed(counter, histogram, **labels):
+    """Count one call by outcome and record how long it took.
+
+    Yields the labels dict so the block can fill in labels that are only known
+    later, like where a report came from.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield labels
+    except BaseException as e:
+        outcome = error_outcome(e)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+        counter.inc(outcome=outcome, **labels)
+
+def external_request(provider):
+    """Time one external API call; put raise_for_status() inside so HTTP errors count as errors"""
+    return timed(EXTERNAL_REQUESTS, EXTERNAL_SECONDS, provider=provider)
+
+def count_cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+def timed_node(name, node):
+    """Wrap a graph node function so its runs and duration are recorded under `name`"""
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(*args, **kwargs):
+            with timed(GRAPH_NODE_RUNS, GRAPH_NODE_SECONDS, node=name):
+                return await node(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(*args, **kwargs):
+        with timed(GRAPH_NODE_RUNS, GRAPH_NODE_SECONDS, node=name):
+            return node(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,32 @@
+import threading
+import contextvars
+
+# Set for the duration of a report run, next to the cancel flag in utils.cancellation,
+# so census and image code running in worker threads can say what they did
+current_stage_log = contextvars.ContextVar("current_stage_log", default=None)
+
+class StageLog:
+    """Stage notes from a report run's worker threads, drained by whoever shows its progress"""
+
+    def __init__(self):
+        self.notes = []
+        self.lock = threading.Lock()
+
+    def add(self, note):
+        with self.lock:
+            self.notes.append(note)
+
+    def drain(self):
+        with self.lock:
+            notes, self.notes = self.notes, []
+        return notes
+
+def stage_note(stage, name, status, **details):
+    """One step of a report: what ran, for what, and whether it came from a cache"""
+    return {"stage": stage, "name": name, "status": status, **details}
+
+def note_stage(stage, name, status, **details):
+    """Record a step for the current report run; does nothing outside one (CLI tools, prefetch)"""
+    log = current_stage_log.get()
+    if log is not None:
+        log.add(stage_note(stage, name, status, **details))
@@ -0,0 +1,54 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from data_sources.census_api import CENSUS_DATA_VERSION
+from utils import metrics
+from utils.exports import ranking_rows
+
+# Scored rankings behind the report's "more counties" table, so later pages are
+# sliced from the result the report was built from instead of being rescored
+RANKING_CACHE_SIZE = int(os.getenv("RANKING_CACHE_SIZE", 256))
+RANKING_PAGE_SIZE = int(os.getenv("RANKING_PAGE_SIZE", 10))
+MAX_RANKING_PAGE_SIZE = 100
+
+_rankings = OrderedDict()
+_rankings_lock = threading.Lock()
+
+def ranking_id(state_name, counties):
+    """Stable id for a ranking, so re-rendering the same report reuses its entry"""
+    order = [(county.get("fips") or county.get("name"), county.get("final_score")) for county in counties]
+    key = json.dumps([state_name, CENSUS_DATA_VERSION, order], default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+def store_ranking(state_name, counties):
+    """Keep a ranked county list for paging and return its id"""
+    key = ranking_id(state_name, counties)
+    with _rankings_lock:
+        _rankings[key] = {"state_name": state_name, "counties": list(counties)}
+        _rankings.move_to_end(key)
+        while len(_rankings) > RANKING_CACHE_SIZE:
+            _rankings.popitem(last=False)
+    return key
+
+def get_ranking_page(key, offset=0, limit=RANKING_PAGE_SIZE):
+    """One page of a stored ranking as export rows, or None if it is unknown or expired"""
+    with _rankings_lock:
+        ranking = _rankings.get(key)
+        if ranking is not None:
+            _rankings.move_to_end(key)
+    metrics.count_cache_lookup("ranking", ranking is not None)
+    if ranking is None:
+        return None
+
+    counties = ranking["counties"]
+    limit = max(1, min(limit, MAX_RANKING_PAGE_SIZE))
+    page = counties[offset:offset + limit]
+    return {
+        "id": key,
+        "state": ranking["state_name"],
+        "total": len(counties),
+        "offset": offset,
+        "items": ranking_rows(page, ranking["state_name"], start=offset + 1),
+    }
@@ -0,0 +1,142 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from data_sources.census_api import CENSUS_DATA_VERSION
+from utils import metrics
+
+load_dotenv()
+# Finished report contexts for exact form inputs, so repeat submissions skip the graph
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(".cache", "report_cache"))
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 256))
+REPORT_CACHE_DISK_SIZE = int(os.getenv("REPORT_CACHE_DISK_SIZE", 4096))
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", 24 * 3600))
+# Bump when the cached report context changes shape
+REPORT_CACHE_VERSION = 1
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def normalize_cache_inputs(state_names, income, family_size, lifestyle, priorities):
+    """Canonical form of the report form: the same report always maps to the same key"""
+    return {
+        "states": [name.strip() for name in state_names],
+        "income": int(income),
+        "family_size": int(family_size),
+        "lifestyle": (lifestyle or "").strip(),
+        "priorities": (priorities or "").strip(),
+    }
+
+def cache_key(inputs):
+    payload = json.dumps(
+        {**inputs, "data_version": CENSUS_DATA_VERSION, "cache_version": REPORT_CACHE_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cache_path(key):
+    return os.path.join(REPORT_CACHE_DIR, key[:2], f"{key}.json.gz")
+
+def _remember(key, entry):
+    with _lock:
+        _memory[key] = entry
+        _memory.move_to_end(key)
+        while len(_memory) > REPORT_CACHE_SIZE:
+            _memory.popitem(last=False)
+            _stats["evictions"] += 1
+
+def get_cached_report(inputs):
+    """Report context for normalized inputs from memory or disk, or None if missing or expired"""
+    key = cache_key(inputs)
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry and now - entry["created_at"] < REPORT_CACHE_TTL:
+            _memory.move_to_end(key)
+            _stats["memory_hits"] += 1
+            metrics.count_cache_lookup("report", True)
+            return entry["report_context"]
+        if entry:
+            del _memory[key]
+
+    try:
+        with gzip.open(cache_path(key), "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        if now - entry["created_at"] < REPORT_CACHE_TTL:
+            _remember(key, entry)
+            with _lock:
+                _stats["disk_hits"] += 1
+            metrics.count_cache_lookup("report", True)
+            return entry["report_context"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with _lock:
+        _stats["misses"] += 1
+    metrics.count_cache_lookup("report", False)
+    return None
+
+def cache_report(inputs, report_context):
+    """Keep a finished report context in memory and gzip it to disk"""
+    key = cache_key(inputs)
+    entry = {"inputs": inputs, "created_at": time.time(), "report_context": report_context}
+    _remember(key, entry)
+
+    path = cache_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+        prune_disk_cache()
+    except (OSError, TypeError) as e:
+        print(f"⚠️ Could not write report cache entry: {e}")
+    with _lock:
+        _stats["stores"] += 1
+    return key
+
+def prune_disk_cache():
+    """Drop expired entries and the oldest files beyond REPORT_CACHE_DISK_SIZE"""
+    files = []
+    for root, _, names in os.walk(REPORT_CACHE_DIR):
+        for name in names:
+            if name.endswith(".json.gz"):
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+    if len(files) <= REPORT_CACHE_DISK_SIZE:
+        return 0
+
+    files.sort()
+    cutoff = time.time() - REPORT_CACHE_TTL
+    excess = len(files) - REPORT_CACHE_DISK_SIZE
+    removed = 0
+    for mtime, path in files:
+        if removed >= excess and mtime >= cutoff:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def report_cache_info():
+    """Hit/miss counters and current size of the report cache"""
+    with _lock:
+        lookups = _stats["memory_hits"] + _stats["disk_hits"] + _stats["misses"]
+        hits = _stats["memory_hits"] + _stats["disk_hits"]
+        return {
+            **_stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "size": len(_memory),
+            "max_size": REPORT_CACHE_SIZE,
+        }
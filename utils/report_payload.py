@@ -0,0 +1,94 @@
+import json
+from datetime import datetime
+from data_sources.image_apis import get_county_images, has_cached_county_images
+from data_sources.image_store import IMAGE_PROXY_ENABLED, IMAGE_PROXY_PREFIX, THUMBNAIL_WIDTHS, DEFAULT_WIDTH, register_image
+from html_formatting import (
+    RANKING_TABLE_ENABLED, REPORT_TEMPLATES, calculate_homeownership_rate, get_safety_display_data, render_insights_html
+)
+from utils.ranking_cache import store_ranking
+
+# Bump when the payload shape changes, so static/report_renderer.js can tell
+PAYLOAD_VERSION = 2
+
+# How many counties each report type shows, matching the HTML reports
+SINGLE_STATE_COUNTIES = 5
+COMPARISON_COUNTIES = 3
+
+def county_payload(county, state_name, used_urls):
+    """Compact description of one county card; images are left to the page when not cached yet"""
+    county_fips = county.get('fips')
+    images = None
+    if county_fips and has_cached_county_images(county_fips):
+        image_urls = get_county_images(county['name'], state_name, county.get('county_seat'), used_urls, county_fips)
+        # Proxy keys are shorter than the remote URLs and let the page ask for the right size
+        images = [register_image(url) if IMAGE_PROXY_ENABLED else url for url, _ in image_urls]
+
+    safety_data = get_safety_display_data(county)
+    return {
+        "fips": county_fips,
+        "name": county['name'],
+        "home_value": county.get('B25077_001E', 0),
+        "income": county.get('B19013_001E', 0),
+        "population": county.get('B01003_001E', 0),
+        "homeownership": calculate_homeownership_rate(county),
+        "college_rate": county.get('college_degree_rate', 0),
+        "feature": county.get('tags', {}).get('notable_family_feature', 'Great community for families'),
+        "safety": {key: safety_data[key] for key in ("score", "tier", "rating", "color_class", "badge_class")} if safety_data else None,
+        "images": images,
+    }
+
+def state_payload(state_name, counties, limit, used_urls):
+    ranking = None
+    if RANKING_TABLE_ENABLED and len(counties) > limit:
+        # The rest of the ranking stays on the server and is paged in by static/ranking_table.js
+        ranking = {"id": store_ranking(state_name, counties), "shown": limit, "total": len(counties)}
+    return {
+        "name": state_name,
+        "counties": [county_payload(county, state_name, used_urls) for county in counties[:limit]],
+        "ranking": ranking,
+    }
+
+def build_report_payload(report_context):
+    """Compact JSON-ready document for a report context: counties, scores, image refs and insights HTML"""
+    args = report_context["args"]
+    used_urls = set()
+    if report_context["type"] == "single_state":
+        states = [state_payload(args["state_name"], args["counties"], SINGLE_STATE_COUNTIES, used_urls)]
+    else:
+        states = [
+            state_payload(args["name1"], args["counties1"], COMPARISON_COUNTIES, used_urls),
+            state_payload(args["name2"], args["counties2"], COMPARISON_COUNTIES, used_urls),
+        ]
+
+    payload = {
+        "v": PAYLOAD_VERSION,
+        "type": report_context["type"],
+        "income": args["income"],
+        "date": datetime.now().strftime("%B %d, %Y"),
+        "image_proxy": {"prefix": IMAGE_PROXY_PREFIX, "widths": THUMBNAIL_WIDTHS, "default_width": DEFAULT_WIDTH} if IMAGE_PROXY_ENABLED else None,
+        "states": states,
+    }
+    # Rendered here with the same markdown converter and fallbacks as the HTML reports
+    payload["insights_html"], payload["recommendation_html"] = render_insights_html(
+        report_context["type"], args.get("insights"), args.get("recommendation")
+    )
+    return payload
+
+def json_script_html(data, attributes=""):
+    """JSON in an inert <script> block; unlike an attribute it needs no HTML escaping"""
+    # "<" is the only character that could end the block early
+    text = json.dumps(data, separators=(",", ":")).replace("<", "\\u003c")
+    return f'<script type="application/json"{attributes}>{text}</script>'
+
+def report_templates_html():
+    """The report templates for the page head, so the renderer and the server share one copy"""
+    return json_script_html(REPORT_TEMPLATES, ' id="report-templates"')
+
+def report_payload_html(report_context):
+    """Inert wrapper the page script turns into a report"""
+    return (
+        '<div class="report-json-root">'
+        + json_script_html(build_report_payload(report_context), ' class="report-json-payload"')
+        + '<p class="report-json-loading">Rendering report…</p>'
+        '</div>'
+    )
@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import hashlib
+from dotenv import load_dotenv
+from data_sources.census_api import CENSUS_DATA_VERSION
+from scoring.county_scoring import detect_tier
+
+load_dotenv()
+REPORT_STORE_DIR = os.getenv("REPORT_STORE_DIR", os.path.join(".cache", "reports"))
+# Bump when the stored report context changes shape
+REPORT_STORE_VERSION = 1
+
+# Income each budget tier is pre-generated at
+TIER_INCOMES = {
+    "affordable": 120000,
+    "move_up": 350000,
+    "luxury": 750000,
+    "ultra_luxury": 1500000,
+}
+
+def normalize_report_inputs(state_name, income, family_size, lifestyle, priorities):
+    """Reduce form inputs to what a stored report is keyed on; income only matters through its tier"""
+    return {
+        "state": state_name,
+        "tier": detect_tier(int(income)),
+        "family_size": int(family_size),
+        "lifestyle": lifestyle,
+        "priorities": priorities,
+    }
+
+def report_key(inputs):
+    """Content address for a set of normalized inputs and the data they were built from"""
+    payload = json.dumps(
+        {**inputs, "data_version": CENSUS_DATA_VERSION, "store_version": REPORT_STORE_VERSION},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def report_path(key):
+    return os.path.join(REPORT_STORE_DIR, key[:2], f"{key}.json")
+
+def save_report(inputs, report_context):
+    """Store the report context for a set of normalized inputs"""
+    key = report_key(inputs)
+    path = report_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"inputs": inputs, "created_at": time.time(), "report_context": report_context}, f)
+    os.replace(temp_path, path)
+    return key
+
+def load_report(inputs):
+    """Return the stored report context for normalized inputs, or None"""
+    try:
+        with open(report_path(report_key(inputs)), encoding="utf-8") as f:
+            return json.load(f)["report_context"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def has_report(inputs):
+    return os.path.exists(report_path(report_key(inputs)))
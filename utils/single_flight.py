@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from utils.cancellation import ReportCancelled
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Run one computation per key at a time; identical calls made meanwhile wait for its result.
+
+    For blocking code (census and image lookups run in worker threads).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.counters = {"leaders": 0, "joined": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.counters["leaders"] += 1
+            else:
+                self.counters["joined"] += 1
+
+        if not leader:
+            call.done.wait()
+            # The leader's report was cancelled, not this one: do the work here instead
+            if isinstance(call.error, ReportCancelled):
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+    def metrics(self):
+        with self.lock:
+            return {**self.counters, "in_flight": len(self.calls)}
+
+class AsyncSingleFlight:
+    """Share an in-flight result between identical requests on the event loop.
+
+    The first request calls lead() and later settle(); requests arriving in
+    between get the same future from join(). A None result tells followers
+    the leader gave up, so they should compute it themselves.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.flights = {}
+        self.counters = {"leaders": 0, "joined": 0}
+
+    def join(self, key):
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.counters["joined"] += 1
+        return flight
+
+    def lead(self, key):
+        """Register as the request computing `key`; returns None if another request already is"""
+        if key in self.flights:
+            return None
+        flight = self.flights[key] = asyncio.get_running_loop().create_future()
+        self.counters["leaders"] += 1
+        return flight
+
+    def settle(self, key, flight, result):
+        if flight is None:
+            return
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.done():
+            flight.set_result(result)
+
+    def metrics(self):
+        return {**self.counters, "in_flight": len(self.flights)}
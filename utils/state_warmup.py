@@ -0,0 +1,148 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from data_sources import rate_limit
+from data_sources.census_api import STATE_FIPS, has_cached_census_data
+from data_sources.image_apis import configured_providers, get_county_images, has_cached_county_images
+from data_sources.image_prefetch import PREFETCH_BUCKET_FRACTION
+from scoring.county_scoring import detect_tier
+from utils.cancellation import ReportCancelled, current_cancel_event, raise_if_cancelled
+
+load_dotenv()
+# Start fetching a state's data as soon as it is picked in the form, before Generate is pressed
+STATE_WARMUP_ENABLED = os.getenv("STATE_WARMUP_ENABLED", "true").lower() == "true"
+# Few workers and a quota reserve keep warm-ups behind live reports
+STATE_WARMUP_WORKERS = int(os.getenv("STATE_WARMUP_WORKERS", 2))
+# Top-ranked counties whose images are warmed; a single-state report shows five
+STATE_WARMUP_COUNTIES = int(os.getenv("STATE_WARMUP_COUNTIES", 5))
+# Give up on images rather than hold a worker while provider quotas refill
+STATE_WARMUP_MAX_WAIT = float(os.getenv("STATE_WARMUP_MAX_WAIT", 30))
+
+class WarmupJob:
+    """Warming of one state for one budget tier and set of preferences, shared by every form field that wants it"""
+
+    def __init__(self, key):
+        self.key = key
+        self.state_name = key[0]
+        self.owners = set()
+        # Also the job's cancel flag, so census and image code stop through raise_if_cancelled
+        self.stop_event = threading.Event()
+
+class StateWarmup:
+    """Background warming of census data, scores and top county images for selected states.
+
+    Owners are (session, field) pairs. Jobs are keyed by state, budget tier and
+    preferences, since those decide which counties rank on top. Changing any of
+    them in the same field releases the previous job, and a job is cancelled
+    once no owner wants it.
+    Census and image lookups go through their single flights, so a report
+    started mid-warm-up joins the fetches instead of repeating them.
+    """
+
+    def __init__(self, workers=STATE_WARMUP_WORKERS):
+        self.workers = workers
+        self.executor = None
+        self.jobs = {}
+        self.owned = {}
+        self.lock = threading.Lock()
+        self.counters = {"started": 0, "joined": 0, "cancelled": 0, "completed": 0, "already_warm": 0, "failed": 0}
+
+    def request(self, owner, state_name, income, user_preferences):
+        """Warm `state_name` for `owner`, releasing whatever that owner asked for before"""
+        key = (state_name, detect_tier(income), user_preferences)
+        with self.lock:
+            previous = self.owned.get(owner)
+            if previous == key:
+                return
+            if previous:
+                self._release(owner, previous)
+            if state_name not in STATE_FIPS:
+                self.owned.pop(owner, None)
+                return
+
+            self.owned[owner] = key
+            job = self.jobs.get(key)
+            if job is not None:
+                job.owners.add(owner)
+                self.counters["joined"] += 1
+                return
+            job = self.jobs[key] = WarmupJob(key)
+            job.owners.add(owner)
+            self.counters["started"] += 1
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="state-warmup")
+
+        # A fresh context, so the job's cancel flag never leaks into other pool work
+        self.executor.submit(contextvars.Context().run, self._run, job, income, user_preferences)
+
+    def release(self, owner):
+        """Drop an owner's interest, e.g. when its field is cleared"""
+        with self.lock:
+            key = self.owned.pop(owner, None)
+            if key:
+                self._release(owner, key)
+
+    def _release(self, owner, key):
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        job.owners.discard(owner)
+        if not job.owners:
+            job.stop_event.set()
+            del self.jobs[key]
+            self.counters["cancelled"] += 1
+
+    def _run(self, job, income, user_preferences):
+        current_cancel_event.set(job.stop_event)
+        outcome = "failed"
+        try:
+            outcome = warm_state(job.state_name, income, user_preferences, job.stop_event)
+        except ReportCancelled:
+            outcome = None
+        except Exception as e:
+            print(f"⚠️ Warm-up for {job.state_name} failed: {e}")
+        finally:
+            with self.lock:
+                if outcome:
+                    self.counters[outcome] += 1
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+                    for owner in job.owners:
+                        if self.owned.get(owner) == job.key:
+                            del self.owned[owner]
+
+    def metrics(self):
+        with self.lock:
+            return {**self.counters, "in_progress": len(self.jobs)}
+
+def warm_state(state_name, income, user_preferences, stop_event=None):
+    """Fetch and score a state's counties, then resolve images for the top ones.
+
+    Returns "completed", or "already_warm" when nothing had to be fetched.
+    Raises ReportCancelled once the job's cancel flag (the current run's, see
+    utils.cancellation) is set; `stop_event` also cuts quota waits short.
+    """
+    # Imported here to keep this module free of the tool module's import cost until first use
+    from scoring.ranking import rank_state_counties
+
+    census_cached = has_cached_census_data(STATE_FIPS[state_name])
+    ranking = rank_state_counties(state_name, income, user_preferences)
+    if ranking.get("error"):
+        raise RuntimeError(ranking["error"])
+
+    missing = [
+        county for county in ranking["counties"][:STATE_WARMUP_COUNTIES]
+        if county.get("fips") and not has_cached_county_images(county["fips"])
+    ]
+    for county in missing:
+        # Only use quota the live reports are not about to need
+        if not rate_limit.wait_for_capacity(configured_providers(), PREFETCH_BUCKET_FRACTION,
+                                            stop_event, STATE_WARMUP_MAX_WAIT):
+            break
+        get_county_images(county["name"], state_name, county.get("county_seat"), county_fips=county["fips"])
+    raise_if_cancelled()
+    return "already_warm" if census_cached and not missing else "completed"
+
+state_warmup = StateWarmup()
@@ -33,4 +33,27 @@ def parse_user_priority(user_preferences: str) -> dict:
     if any(word in pref_lower for word in ["growth", "investment", "appreciation", "job market", "economy"]):
         priority["growth"] = True
     
-    return priority 
\ No newline at end of file
+    return priority 
+
+
+# Options offered by the web form
+LIFESTYLE_CHOICES = [
+    "Urban (city amenities, walkable, public transit)",
+    "Suburban (family neighborhoods, good schools, parks)",
+    "Rural (space, nature, quiet, lower cost)"
+]
+DEFAULT_LIFESTYLE = LIFESTYLE_CHOICES[1]
+
+PRIORITY_CHOICES = [
+    "Affordability (lower cost of living, value for money)",
+    "Investment Growth (property appreciation, job markets)",
+    "Family Safety (low crime, good schools, healthcare)",
+    "Balanced (mix of affordability, growth, and safety)"
+]
+DEFAULT_PRIORITY = PRIORITY_CHOICES[3]
+DEFAULT_FAMILY_SIZE = 4
+
+
+def build_user_preferences(family_size, lifestyle, priorities) -> str:
+    """Preferences string built from the form inputs, as parse_user_priority expects it."""
+    return f"Family size: {family_size}. Lifestyle: {lifestyle}. Priorities: {priorities}"